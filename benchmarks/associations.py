@@ -0,0 +1,103 @@
+#!/usr/bin/env python3 -u
+
+import os
+import re
+import sys
+import logging
+import tempfile
+import subprocess as sp
+from argparse import ArgumentParser
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import fake_scp
+
+logger = logging.getLogger('associations')
+logging.basicConfig(level=logging.INFO)
+logging.getLogger('pynetdicom').setLevel(logging.WARNING)
+
+ROOT = os.path.dirname(here)
+SCRIPTS = os.path.join(ROOT, 'scripts')
+
+# the warning xnat_dicom_send.py logs before retrying files
+RETRY = re.compile(r'retrying (\d+) files on a new association')
+
+def main():
+    parser = ArgumentParser(description='Check xnat_dicom_send.py --associations and --retries against a local SCP')
+    parser.add_argument('--files', type=int, default=24,
+        help='Number of files in the synthetic corpus')
+    parser.add_argument('--series', type=int, default=8,
+        help='Number of series the files are split across')
+    parser.add_argument('--frames', type=int, default=2,
+        help='Frames per file, 256x256 16-bit frames are 128 KB each')
+    parser.add_argument('--associations', type=int, nargs='+', default=[2, 4],
+        help='Values of --associations to check')
+    parser.add_argument('--fail', type=int, default=3,
+        help='Number of files the SCP refuses the first time they are sent')
+    parser.add_argument('--latency', type=float, default=0.02,
+        help='Seconds the SCP waits before answering each C-STORE')
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmpdir:
+        directory = os.path.join(tmpdir, 'corpus')
+        fake_scp.synthesize(directory, files=args.files, frames=args.frames, series=args.series)
+        for associations in args.associations:
+            stats,retried = run(associations, directory, args)
+            logger.info(f'--associations {associations}: stored {stats["stored"]} files, '
+                        f'at most {stats["peak"]} connections open, '
+                        f'{stats["refused"]} refused and {retried} retried')
+            instances = stats['instances']
+            if len(instances) != args.files:
+                logger.error(f'--associations {associations} stored {len(instances)} '
+                             f'of {args.files} files')
+                failed = True
+            duplicates = sum(1 for n in instances.values() if n > 1)
+            if duplicates:
+                logger.error(f'--associations {associations} stored {duplicates} files more than once')
+                failed = True
+            if associations > 1 and stats['peak'] < 2:
+                logger.error(f'--associations {associations} never had more than one association open')
+                failed = True
+            if stats['refused'] != args.fail or retried != args.fail:
+                logger.error(f'--associations {associations} retried {retried} files '
+                             f'after {stats["refused"]} were refused')
+                failed = True
+    if failed:
+        sys.exit(1)
+    logger.info('every file was stored once, over concurrent associations and retries')
+
+def run(associations, directory, args):
+    '''
+    Send a directory with xnat_dicom_send.py to a fresh local SCP that
+    refuses some files once, and return what the SCP received and the
+    number of files the sender retried.
+    '''
+    scp = fake_scp.FakeScp(latency=args.latency, fail=args.fail).start()
+    try:
+        command = [
+            sys.executable,
+            os.path.join(SCRIPTS, 'xnat_dicom_send.py'),
+            '--project', 'BENCH',
+            '--subject', 'BENCH',
+            '--session', 'BENCH',
+            '--hostname', scp.host,
+            '--port', str(scp.port),
+            '--ae-title', scp.ae_title,
+            '--associations', str(associations),
+            '--retries', '1',
+            '--no-journal',
+            directory
+        ]
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([ROOT, env.get('PYTHONPATH', '')])
+        proc = sp.run(command, env=env, check=True, stdout=sp.DEVNULL, stderr=sp.PIPE,
+                      universal_newlines=True)
+    finally:
+        scp.stop()
+    retried = sum(int(x) for x in RETRY.findall(proc.stderr))
+    return scp.stats(),retried
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3 -u
+
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import subprocess as sp
+from argparse import ArgumentParser
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import fake_xnat
+
+logger = logging.getLogger('bench')
+logging.basicConfig(level=logging.INFO)
+
+ROOT = os.path.dirname(here)
+SCRIPTS = os.path.join(ROOT, 'scripts')
+BASELINE = os.path.join(here, 'baseline.json')
+
+AUTH = '''<xnat>
+  <bench>
+    <url>{url}</url>
+    <username>bench</username>
+    <password>bench</password>
+  </bench>
+</xnat>
+'''
+
+def main():
+    parser = ArgumentParser(description='Benchmark realta against a local fake XNAT')
+    parser.add_argument('--experiments', type=int, default=50,
+        help='Number of sessions in the synthetic project')
+    parser.add_argument('--scans', type=int, default=20,
+        help='Number of scans per session')
+    parser.add_argument('--tagged', type=float, default=0.5,
+        help='Fraction of scans that already carry the correct tag')
+    parser.add_argument('--typed', type=float, default=0.5,
+        help='Fraction of scans that already have the correct type')
+    parser.add_argument('--latency', type=float, default=0.005,
+        help='Seconds of latency added to every request')
+    parser.add_argument('--tag-sessions', type=int, default=5,
+        help='Number of sessions to run star_set_tags.py against')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--flows', nargs='+', default=list(FLOWS), choices=list(FLOWS))
+    parser.add_argument('--baseline', default=BASELINE,
+        help='Request counts to compare against')
+    parser.add_argument('--update-baseline', action='store_true',
+        help='Write request counts to --baseline instead of comparing')
+    parser.add_argument('-o', '--output-file',
+        help='Write results as JSON')
+    args = parser.parse_args()
+
+    conf = {
+        'experiments': args.experiments,
+        'scans': args.scans,
+        'tagged': args.tagged,
+        'typed': args.typed,
+        'tag_sessions': args.tag_sessions,
+        'seed': args.seed
+    }
+    results = dict()
+    for name in args.flows:
+        results[name] = run(name, args)
+        stats = results[name]
+        logger.info(f'{name}: {stats["wall"]:.2f}s, {stats["requests"]} requests, '
+                    f'{stats["bytes"] / 1e6:.2f} MB')
+        for endpoint,n in iter(stats['endpoints'].items()):
+            logger.info(f'    {n:6d} {endpoint}')
+
+    if args.output_file:
+        with open(args.output_file, 'w') as fo:
+            json.dump({'config': conf, 'results': results}, fo, indent=2)
+
+    if args.update_baseline:
+        baseline = {
+            'config': conf,
+            'endpoints': dict((k, v['endpoints']) for k,v in iter(results.items()))
+        }
+        with open(args.baseline, 'w') as fo:
+            json.dump(baseline, fo, indent=2)
+            fo.write('\n')
+        logger.info(f'saved baseline to {args.baseline}')
+        return
+    if regressions(args.baseline, conf, results):
+        sys.exit(1)
+
+def regressions(filename, conf, results):
+    '''
+    Compare request counts per endpoint to a baseline recorded with the
+    same configuration and return the number of regressions.
+    '''
+    if not os.path.exists(filename):
+        logger.warning(f'no baseline found at {filename}')
+        return 0
+    with open(filename) as fo:
+        baseline = json.load(fo)
+    if baseline['config'] != conf:
+        logger.warning(f'baseline was recorded with {baseline["config"]}, not comparing')
+        return 0
+    found = 0
+    for name,stats in iter(results.items()):
+        expected = baseline['endpoints'].get(name, None)
+        if expected is None:
+            continue
+        for endpoint in sorted(set(expected) | set(stats['endpoints'])):
+            before = expected.get(endpoint, 0)
+            after = stats['endpoints'].get(endpoint, 0)
+            if after > before:
+                logger.error(f'{name}: {endpoint} went from {before} to {after} requests')
+                found += 1
+    if not found:
+        logger.info('no request count regressions')
+    return found
+
+def run(name, args):
+    '''
+    Run a flow against a fresh fake XNAT and return its wall time, request
+    counts, and bytes transferred.
+    '''
+    sessions = fake_xnat.synthesize(
+        experiments=args.experiments,
+        scans=args.scans,
+        tagged=args.tagged,
+        typed=args.typed,
+        seed=args.seed
+    )
+    server = fake_xnat.FakeXnat(sessions, latency=args.latency).start()
+    try:
+        with tempfile.TemporaryDirectory() as home:
+            with open(os.path.join(home, '.xnat_auth'), 'w') as fo:
+                fo.write(AUTH.format(url=server.url))
+            env = dict(os.environ)
+            env['HOME'] = home
+            env['PYTHONPATH'] = os.pathsep.join([ROOT, env.get('PYTHONPATH', '')])
+            commands = FLOWS[name](sessions, home, args)
+            start = time.monotonic()
+            for command in commands:
+                sp.run([sys.executable] + command, env=env, check=True,
+                       stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+            wall = time.monotonic() - start
+    finally:
+        server.stop()
+    stats = server.stats()
+    stats['wall'] = wall
+    return stats
+
+def audit(sessions, home, args):
+    return [[
+        os.path.join(SCRIPTS, 'star_tag_audit.py'),
+        '--xnat', 'bench',
+        '--project', fake_xnat.PROJECT,
+        '--jobs', '4',
+        '-o', os.path.join(home, 'audit.csv')
+    ]]
+
+def tag(sessions, home, args):
+    commands = list()
+    for session in list(sessions.values())[:args.tag_sessions]:
+        commands.append([
+            os.path.join(SCRIPTS, 'star_set_tags.py'),
+            '--xnat', 'bench',
+            '--session', session['label'],
+            '--do-updates'
+        ])
+    return commands
+
+def types(sessions, home, args):
+    return [[
+        os.path.join(SCRIPTS, 'star_set_types.py'),
+        '--xnat', 'bench',
+        '--project', fake_xnat.PROJECT,
+        '--do-updates'
+    ]]
+
+def reconcile(sessions, home, args):
+    return [[
+        os.path.join(SCRIPTS, 'star_reconcile.py'),
+        '--xnat', 'bench',
+        '--project', fake_xnat.PROJECT,
+        '--do-updates'
+    ]]
+
+FLOWS = {
+    'audit': audit,
+    'tag': tag,
+    'types': types,
+    'reconcile': reconcile
+}
+
+if __name__ == '__main__':
+    main()
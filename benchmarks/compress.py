@@ -0,0 +1,138 @@
+#!/usr/bin/env python3 -u
+
+import os
+import re
+import sys
+import json
+import time
+import logging
+import tempfile
+import subprocess as sp
+from argparse import ArgumentParser
+from pydicom.uid import RLELossless, ImplicitVRLittleEndian
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import fake_scp
+
+logger = logging.getLogger('compress')
+logging.basicConfig(level=logging.INFO)
+logging.getLogger('pynetdicom').setLevel(logging.WARNING)
+
+ROOT = os.path.dirname(here)
+SCRIPTS = os.path.join(ROOT, 'scripts')
+
+# case to (xnat_dicom_send.py arguments, transfer syntaxes the SCP accepts),
+# without RLE Lossless files fall back to being streamed as they are, and
+# without their own transfer syntax either they are decoded and converted,
+# and the mixed case adds SR documents, which have no Pixel Data to compress
+CASES = {
+    'uncompressed': ([], fake_scp.SYNTAXES),
+    'compressed': (['--compress'], fake_scp.SYNTAXES),
+    'fallback': (['--compress'], [x for x in fake_scp.SYNTAXES if x != RLELossless]),
+    'decoded': (['--compress'], [ImplicitVRLittleEndian]),
+    'mixed': (['--compress'], fake_scp.SYNTAXES)
+}
+
+# the summary xnat_dicom_send.py logs when it is done
+REPORT = re.compile(r'sent ([\d.]+) MB on the wire for ([\d.]+) MB of files')
+
+def main():
+    parser = ArgumentParser(description='Measure bytes on the wire of xnat_dicom_send.py --compress against a local SCP')
+    parser.add_argument('--files', type=int, default=20,
+        help='Number of files in the synthetic corpus')
+    parser.add_argument('--frames', type=int, default=16,
+        help='Frames per file, 256x256 16-bit frames are 128 KB each')
+    parser.add_argument('--reports', type=int, default=2,
+        help='Number of SR documents added to the corpus in the mixed case')
+    parser.add_argument('--cases', nargs='+', default=list(CASES), choices=list(CASES))
+    parser.add_argument('-o', '--output-file',
+        help='Write results as JSON')
+    args = parser.parse_args()
+
+    results = dict()
+    originals = dict()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        directory = os.path.join(tmpdir, 'corpus')
+        fake_scp.synthesize(directory, files=args.files, frames=args.frames)
+        mixed = os.path.join(tmpdir, 'mixed')
+        fake_scp.synthesize(mixed, files=args.files, frames=args.frames)
+        fake_scp.reports(mixed, files=args.reports)
+        for name in args.cases:
+            corpus = mixed if name == 'mixed' else directory
+            original = sum(os.path.getsize(os.path.join(corpus, x)) for x in os.listdir(corpus))
+            originals[name] = original
+            stats = run(name, corpus)
+            results[name] = stats
+            logger.info(f'{name:12s} {stats["bytes"] / 1e6:.1f} MB on the wire for '
+                        f'{original / 1e6:.1f} MB of files ({stats["bytes"] / original:.0%}), '
+                        f'{stats["files_per_second"]:.1f} files/s, '
+                        f'reported {stats["reported_wire"]:.1f} of {stats["reported_original"]:.1f} MB')
+
+    if args.output_file:
+        with open(args.output_file, 'w') as fo:
+            json.dump(results, fo, indent=2)
+
+    failed = False
+    for name,stats in iter(results.items()):
+        files = args.files + (args.reports if name == 'mixed' else 0)
+        if stats['stored'] != files:
+            logger.error(f'{name} stored {stats["stored"]} of {files} files')
+            failed = True
+        # every file is counted once, including files that fell back
+        original = originals[name]
+        if abs(stats['reported_original'] - original / 1e6) > 0.1:
+            logger.error(f'{name} reported {stats["reported_original"]:.1f} MB of files '
+                         f'instead of {original / 1e6:.1f} MB')
+            failed = True
+        rle = stats['syntaxes'].get(RLELossless, 0)
+        arguments,syntaxes = CASES[name]
+        expected = args.files if '--compress' in arguments and RLELossless in syntaxes else 0
+        if rle != expected:
+            logger.error(f'{name} sent {rle} files with RLE Lossless instead of {expected}')
+            failed = True
+    if 'compressed' in results and 'uncompressed' in results:
+        if results['compressed']['bytes'] >= results['uncompressed']['bytes']:
+            logger.error('compressed sends were not smaller than uncompressed sends')
+            failed = True
+    if failed:
+        sys.exit(1)
+
+def run(name, directory):
+    '''
+    Send a directory with xnat_dicom_send.py to a fresh local SCP and return
+    what the SCP received and what the sender reported.
+    '''
+    arguments,syntaxes = CASES[name]
+    scp = fake_scp.FakeScp(syntaxes=syntaxes).start()
+    try:
+        command = [
+            sys.executable,
+            os.path.join(SCRIPTS, 'xnat_dicom_send.py'),
+            '--project', 'BENCH',
+            '--subject', 'BENCH',
+            '--session', 'BENCH',
+            '--hostname', scp.host,
+            '--port', str(scp.port),
+            '--ae-title', scp.ae_title,
+            '--no-journal'
+        ] + arguments + [directory]
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([ROOT, env.get('PYTHONPATH', '')])
+        start = time.monotonic()
+        proc = sp.run(command, env=env, check=True, stdout=sp.DEVNULL, stderr=sp.PIPE,
+                      universal_newlines=True)
+        wall = time.monotonic() - start
+    finally:
+        scp.stop()
+    match = REPORT.search(proc.stderr)
+    stats = scp.stats()
+    stats['wall'] = wall
+    stats['files_per_second'] = stats['stored'] / wall
+    stats['reported_wire'] = float(match.group(1)) if match else 0.0
+    stats['reported_original'] = float(match.group(2)) if match else 0.0
+    return stats
+
+if __name__ == '__main__':
+    main()
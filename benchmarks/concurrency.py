@@ -0,0 +1,93 @@
+#!/usr/bin/env python3 -u
+
+import os
+import sys
+import time
+import logging
+import tempfile
+import subprocess as sp
+from argparse import ArgumentParser
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import fake_xnat
+from bench import AUTH, ROOT, SCRIPTS
+
+logger = logging.getLogger('concurrency')
+logging.basicConfig(level=logging.INFO)
+
+def main():
+    parser = ArgumentParser(description='Check that star_tag_audit.py --jobs bounds the requests in flight')
+    parser.add_argument('--experiments', type=int, default=24,
+        help='Number of sessions, each in its own project so that its scans are listed on their own')
+    parser.add_argument('--scans', type=int, default=10,
+        help='Number of scans per session')
+    parser.add_argument('--latency', type=float, default=0.05,
+        help='Seconds of latency added to every request')
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 2, 4, 8],
+        help='Values of --jobs to check')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    failed = False
+    outputs = dict()
+    for jobs in args.jobs:
+        peak,wall,output = run(jobs, args)
+        outputs[jobs] = output
+        logger.info(f'--jobs {jobs}: at most {peak} requests in flight, {wall:.2f}s')
+        if peak > jobs:
+            logger.error(f'--jobs {jobs} had {peak} requests in flight')
+            failed = True
+        if jobs > 1 and args.experiments > 1 and peak < 2:
+            logger.error(f'--jobs {jobs} never had more than one request in flight')
+            failed = True
+    # rows are written in the same order no matter how many jobs are used
+    first = outputs[args.jobs[0]]
+    for jobs,output in iter(outputs.items()):
+        if output != first:
+            logger.error(f'--jobs {jobs} wrote different output than --jobs {args.jobs[0]}')
+            failed = True
+    if failed:
+        sys.exit(1)
+    logger.info('concurrency is bounded by --jobs and output order is stable')
+
+def run(jobs, args):
+    '''
+    Run an audit against a fresh fake XNAT and return the largest number of
+    requests in flight, the wall time, and the CSV written.
+    '''
+    sessions = fake_xnat.synthesize(
+        experiments=args.experiments,
+        scans=args.scans,
+        seed=args.seed
+    )
+    for i,session in enumerate(sessions.values()):
+        session['project'] = f'{fake_xnat.PROJECT}{i:03d}'
+    server = fake_xnat.FakeXnat(sessions, latency=args.latency).start()
+    try:
+        with tempfile.TemporaryDirectory() as home:
+            with open(os.path.join(home, '.xnat_auth'), 'w') as fo:
+                fo.write(AUTH.format(url=server.url))
+            env = dict(os.environ)
+            env['HOME'] = home
+            env['PYTHONPATH'] = os.pathsep.join([ROOT, env.get('PYTHONPATH', '')])
+            output = os.path.join(home, 'audit.csv')
+            command = [
+                sys.executable,
+                os.path.join(SCRIPTS, 'star_tag_audit.py'),
+                '--xnat', 'bench',
+                '--jobs', str(jobs),
+                '-o', output
+            ]
+            start = time.monotonic()
+            sp.run(command, env=env, check=True, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+            wall = time.monotonic() - start
+            with open(output) as fo:
+                rows = fo.read()
+    finally:
+        server.stop()
+    return server.stats()['peak'],wall,rows
+
+if __name__ == '__main__':
+    main()
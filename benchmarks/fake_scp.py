@@ -0,0 +1,199 @@
+import os
+import time
+import array
+import random
+import logging
+import threading
+import collections as col
+import pynetdicom
+from pydicom.dataset import Dataset, FileMetaDataset
+from pydicom.uid import generate_uid, ExplicitVRLittleEndian, RLELossless
+
+logger = logging.getLogger(__name__)
+
+# transfer syntaxes accepted by default, the uncompressed ones and RLE Lossless
+SYNTAXES = list(pynetdicom.DEFAULT_TRANSFER_SYNTAXES) + [RLELossless]
+
+def synthesize(directory, files=20, frames=8, rows=256, columns=256, series=1, seed=0):
+    '''
+    Write a synthetic single study of multi-frame MR images to a directory
+    and return the file names. Files are dealt round robin into the given
+    number of series. Every frame is a shifted copy of a noisy phantom on an
+    empty background, so the pixel data compresses roughly the way real
+    images do.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    base = phantom(rows, columns, seed=seed)
+    row = columns * 2
+    study = generate_uid(entropy_srcs=[str(seed), 'study'])
+    uids = [generate_uid(entropy_srcs=[str(seed), 'series', str(x)]) for x in range(series)]
+    filenames = list()
+    for i in range(files):
+        pixels = bytearray()
+        for j in range(frames):
+            shift = ((i + j) % rows) * row
+            pixels += base[shift:] + base[:shift]
+        uid = generate_uid(entropy_srcs=[str(seed), str(i)])
+        meta = FileMetaDataset()
+        meta.MediaStorageSOPClassUID = pynetdicom.sop_class.MRImageStorage
+        meta.MediaStorageSOPInstanceUID = uid
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds = Dataset()
+        ds.file_meta = meta
+        ds.SOPClassUID = meta.MediaStorageSOPClassUID
+        ds.SOPInstanceUID = uid
+        ds.StudyInstanceUID = study
+        ds.SeriesInstanceUID = uids[i % series]
+        ds.Modality = 'MR'
+        ds.PatientID = 'BENCH'
+        ds.PatientName = 'BENCH'
+        ds.SeriesNumber = i % series + 1
+        ds.InstanceNumber = i // series + 1
+        ds.SamplesPerPixel = 1
+        ds.PhotometricInterpretation = 'MONOCHROME2'
+        ds.NumberOfFrames = frames
+        ds.Rows = rows
+        ds.Columns = columns
+        ds.BitsAllocated = 16
+        ds.BitsStored = 16
+        ds.HighBit = 15
+        ds.PixelRepresentation = 0
+        ds.PixelData = bytes(pixels)
+        filename = os.path.join(directory, f'{i:05d}.dcm')
+        ds.save_as(filename, enforce_file_format=True)
+        filenames.append(filename)
+    return filenames
+
+def reports(directory, files=2, seed=0):
+    '''
+    Write synthetic Basic Text SR documents, which have no Pixel Data, to the
+    same study as synthesize and return the file names.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    study = generate_uid(entropy_srcs=[str(seed), 'study'])
+    series = generate_uid(entropy_srcs=[str(seed), 'report'])
+    filenames = list()
+    for i in range(files):
+        uid = generate_uid(entropy_srcs=[str(seed), 'report', str(i)])
+        meta = FileMetaDataset()
+        meta.MediaStorageSOPClassUID = pynetdicom.sop_class.BasicTextSRStorage
+        meta.MediaStorageSOPInstanceUID = uid
+        meta.TransferSyntaxUID = ExplicitVRLittleEndian
+        ds = Dataset()
+        ds.file_meta = meta
+        ds.SOPClassUID = meta.MediaStorageSOPClassUID
+        ds.SOPInstanceUID = uid
+        ds.StudyInstanceUID = study
+        ds.SeriesInstanceUID = series
+        ds.Modality = 'SR'
+        ds.PatientID = 'BENCH'
+        ds.PatientName = 'BENCH'
+        ds.SeriesNumber = 99
+        ds.InstanceNumber = i + 1
+        ds.ValueType = 'CONTAINER'
+        ds.ContinuityOfContent = 'SEPARATE'
+        ds.CompletionFlag = 'COMPLETE'
+        ds.VerificationFlag = 'UNVERIFIED'
+        filename = os.path.join(directory, f'sr{i:05d}.dcm')
+        ds.save_as(filename, enforce_file_format=True)
+        filenames.append(filename)
+    return filenames
+
+def phantom(rows, columns, seed=0):
+    '''
+    Return one frame of 16-bit pixel data with a bright, noisy disk on a
+    dark background.
+    '''
+    rng = random.Random(seed)
+    pixels = array.array('H')
+    radius = min(rows, columns) * 0.35
+    for y in range(rows):
+        for x in range(columns):
+            inside = (x - columns / 2) ** 2 + (y - rows / 2) ** 2 < radius ** 2
+            pixels.append(400 + (x // 8) * 10 + rng.randrange(32) if inside else 0)
+    return pixels.tobytes()
+
+class FakeScp:
+    '''
+    Local storage SCP that accepts every storage SOP Class and discards
+    what it receives, with the given transfer syntaxes. Stored files, the
+    bytes of their encoded datasets, the transfer syntaxes used, how many
+    times each instance was stored, and the connections open at once are
+    counted.
+
+    Each C-STORE waits latency seconds, and the first fail instances
+    received are refused once with Out of Resources (0xA700) so that the
+    sender has to retry them.
+    '''
+    def __init__(self, ae_title='BENCH', syntaxes=SYNTAXES, host='127.0.0.1', port=0,
+                 latency=0, fail=0):
+        self.ae_title = ae_title
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.fail = fail
+        self.stored = 0
+        self.bytes = 0
+        self.syntaxes = col.Counter()
+        self.instances = col.Counter()
+        self.refused = set()
+        self.connections = 0
+        self.open = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        self.ae = pynetdicom.AE(ae_title=ae_title)
+        self.ae.maximum_associations = 16
+        for cx in pynetdicom.AllStoragePresentationContexts:
+            self.ae.add_supported_context(cx.abstract_syntax, syntaxes)
+        self.ae.add_supported_context(pynetdicom.sop_class.Verification)
+        self.server = None
+
+    def start(self):
+        handlers = [
+            (pynetdicom.evt.EVT_C_STORE, self.store),
+            (pynetdicom.evt.EVT_CONN_OPEN, self.connect),
+            (pynetdicom.evt.EVT_CONN_CLOSE, self.disconnect)
+        ]
+        self.server = self.ae.start_server((self.host, self.port), block=False,
+                                           evt_handlers=handlers)
+        self.port = self.server.server_address[1]
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def connect(self, event):
+        with self._lock:
+            self.connections += 1
+            self.open += 1
+            self.peak = max(self.peak, self.open)
+
+    def disconnect(self, event):
+        with self._lock:
+            self.open -= 1
+
+    def store(self, event):
+        time.sleep(self.latency)
+        nbytes = len(event.request.DataSet.getvalue())
+        uid = event.request.AffectedSOPInstanceUID
+        with self._lock:
+            if len(self.refused) < self.fail and uid not in self.refused:
+                self.refused.add(uid)
+                return 0xA700
+            self.stored += 1
+            self.bytes += nbytes
+            self.syntaxes[event.context.transfer_syntax] += 1
+            self.instances[uid] += 1
+        return 0x0000
+
+    def stats(self):
+        with self._lock:
+            return {
+                'stored': self.stored,
+                'bytes': self.bytes,
+                'syntaxes': dict(self.syntaxes),
+                'instances': dict(self.instances),
+                'refused': len(self.refused),
+                'connections': self.connections,
+                'peak': self.peak
+            }
@@ -0,0 +1,322 @@
+import re
+import csv
+import json
+import time
+import yaml
+import random
+import logging
+import threading
+import collections as col
+import realta.config as config
+from urllib.parse import urlparse, parse_qsl
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+PROJECT = 'STAR'
+
+# endpoint patterns used to group request counts, most specific first
+ENDPOINTS = [
+    ('/data/projects/{project}/subjects/{subject}/experiments/{session}/scans/{scan}',
+        re.compile(r'^/data/projects/[^/]+/subjects/[^/]+/experiments/[^/]+/scans/[^/]+$')),
+    ('/data/experiments/{aid}/scans', re.compile(r'^/data/experiments/[^/]+/scans$')),
+    ('/data/experiments', re.compile(r'^/data/experiments$')),
+    ('/data/JSESSION', re.compile(r'^/data/JSESSION$'))
+]
+
+# scan data types and the search column prefix for each
+SCAN_TYPES = {
+    'xnat:mrScanData': 'xnat:mrscandata',
+    'xnat:srScanData': 'xnat:srscandata',
+    'xnat:scScanData': 'xnat:scscandata',
+    'xnat:otherDicomScanData': 'xnat:otherdicomscandata'
+}
+
+FIELDS = {
+    'xnat:mrscandata/note': 'note',
+    'xnat:mrscandata/type': 'type',
+    'type': 'type',
+    'xnat:mrscandata/quality': 'quality'
+}
+
+def synthesize(experiments=100, scans=20, tagged=0.5, typed=0.5, seed=0):
+    '''
+    Build a synthetic STAR project. Every session gets the given number of
+    scans, drawn evenly from the series in tags.yaml and types.csv. A
+    fraction of the tagged scans already carry the correct note tag and a
+    fraction of the scans in types.csv already have the correct type.
+    '''
+    rng = random.Random(seed)
+    with open(config.tags()) as fo:
+        filters = yaml.load(fo, Loader=yaml.SafeLoader)
+    tagged_series = list()
+    for name,conf in iter(filters.items()):
+        for f in conf['filters']:
+            tagged_series.append((f['series_description'], '\\'.join(f['image_type']), conf['tag']))
+    with open(config.types()) as fo:
+        types = dict((row['Series Description'], row['Type']) for row in csv.DictReader(fo))
+    typed_series = [(x, 'ORIGINAL\\PRIMARY\\M\\ND', None) for x in sorted(types)]
+    sessions = col.OrderedDict()
+    for i in range(experiments):
+        aid = f'XNAT_E{i:05d}'
+        counts = col.Counter()
+        rows = list()
+        for j in range(scans):
+            series = tagged_series if rng.random() < 0.5 else typed_series
+            description,image_type,tag = series[rng.randrange(len(series))]
+            note = ''
+            if tag:
+                counts[tag] += 1
+                if rng.random() < tagged:
+                    note = f'{tag}_{counts[tag]}'
+            scan_type = description
+            if description in types and rng.random() < typed:
+                scan_type = types[description]
+            rows.append({
+                'xsiType': xsitype(description),
+                'id': str(j + 1),
+                'series_description': description,
+                'image_type': image_type,
+                'quality': 'usable',
+                'note': note,
+                'type': scan_type
+            })
+        sessions[aid] = {
+            'ID': aid,
+            'label': f'230101_STAR_{i:04d}_01',
+            'project': PROJECT,
+            'subject_ID': f'XNAT_S{i:05d}',
+            'subject_label': f'STAR_{i:04d}',
+            'last_modified': '2023-01-01 00:00:00.0',
+            'scans': rows
+        }
+    return sessions
+
+class FakeXnat:
+    '''
+    Local stand-in for the parts of the XNAT REST API used by realta and
+    yaxil, serving a synthetic project. Every request is delayed by latency
+    seconds and counted per endpoint along with the bytes transferred. The
+    largest number of requests in flight at once is kept in peak.
+    '''
+    def __init__(self, sessions, latency=0.0, host='127.0.0.1', port=0):
+        self.sessions = sessions
+        self.latency = latency
+        self.counts = col.Counter()
+        self.bytes = 0
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+        handler = type('Handler', (Handler,), {'xnat': self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self.url = f'http://{host}:{self.server.server_address[1]}'
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def enter(self):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def leave(self):
+        with self._lock:
+            self.active -= 1
+
+    def count(self, method, path, nbytes):
+        endpoint = path
+        for name,pattern in ENDPOINTS:
+            if pattern.match(path):
+                endpoint = name
+                break
+        with self._lock:
+            self.counts[f'{method} {endpoint}'] += 1
+            self.bytes += nbytes
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': sum(self.counts.values()),
+                'endpoints': dict(sorted(self.counts.items())),
+                'bytes': self.bytes,
+                'peak': self.peak
+            }
+
+    def experiments(self, params):
+        '''
+        Answer an experiment search. Searches for the columns of a scan data
+        type return one row per scan of that type, like the XNAT search API.
+        '''
+        columns = params.get('columns', '')
+        prefixes = [x for x in SCAN_TYPES.values() if f'{x}/' in columns]
+        rows = list()
+        for aid,session in iter(self.sessions.items()):
+            if 'ID' in params and params['ID'] != aid:
+                continue
+            if 'label' in params and params['label'] != session['label']:
+                continue
+            if 'project' in params and params['project'] != session['project']:
+                continue
+            row = experiment_row(session)
+            if not prefixes:
+                rows.append(row)
+                continue
+            for scan in session['scans']:
+                if SCAN_TYPES[scan['xsiType']] not in prefixes:
+                    continue
+                item = dict(row)
+                item.update(scan_row(scan))
+                rows.append(item)
+        return rows
+
+    def scans(self, aid, params=None):
+        '''
+        Answer a scan listing. Requested columns the fake does not model
+        are returned empty.
+        '''
+        session = self.sessions.get(aid, None)
+        if not session:
+            return None
+        columns = (params or dict()).get('columns', '')
+        rows = list()
+        for scan in session['scans']:
+            row = dict((x, '') for x in columns.split(',') if x)
+            row.update(scan_row(scan))
+            rows.append(row)
+        return rows
+
+    def update(self, label, scan, params):
+        for session in self.sessions.values():
+            if session['label'] != label:
+                continue
+            for item in session['scans']:
+                if item['id'] == scan:
+                    for key,value in iter(params.items()):
+                        if key in FIELDS:
+                            item[FIELDS[key]] = value
+                    session['last_modified'] = time.strftime('%Y-%m-%d %H:%M:%S.0')
+                    return True
+        return False
+
+def experiment_row(session):
+    return {
+        'ID': session['ID'],
+        'URI': f'/data/experiments/{session["ID"]}',
+        'xsiType': 'xnat:mrSessionData',
+        'label': session['label'],
+        'project': session['project'],
+        'subject_ID': session['subject_ID'],
+        'xnat:subjectassessordata/subject_id': session['subject_ID'],
+        'subject_label': session['subject_label'],
+        'subject_project': session['project'],
+        'insert_date': '2023-01-01 00:00:00.0',
+        'last_modified': session['last_modified'],
+        'date': '2023-01-01',
+        'time': '00:00:00',
+        'fieldStrength': '3.0',
+        'note': ''
+    }
+
+def xsitype(description):
+    '''
+    Physio logs and Phoenix reports are not MR scans in XNAT.
+    '''
+    if description == 'PhoenixZIPReport' or description.endswith('_PhysioLog'):
+        return 'xnat:otherDicomScanData'
+    return 'xnat:mrScanData'
+
+def scan_row(scan):
+    '''
+    Every scan data type column is present, only those of the scan's own
+    type have values.
+    '''
+    row = {
+        'xsiType': scan['xsiType'],
+        'ID': scan['id']
+    }
+    for xsitype,prefix in iter(SCAN_TYPES.items()):
+        own = xsitype == scan['xsiType']
+        for key in ('id', 'series_description', 'quality', 'note', 'type'):
+            row[f'{prefix}/{key}'] = scan[key] if own else ''
+    row['xnat:mrscandata/parameters/imagetype'] = ''
+    if scan['xsiType'] == 'xnat:mrScanData':
+        row['xnat:mrscandata/parameters/imagetype'] = scan['image_type']
+    return row
+
+class Handler(BaseHTTPRequestHandler):
+    xnat = None
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, body=b'', content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return len(body)
+
+    def result_set(self, rows):
+        body = {
+            'ResultSet': {
+                'Result': rows,
+                'totalRecords': str(len(rows))
+            }
+        }
+        return self.reply(200, json.dumps(body).encode())
+
+    def handle_request(self, method):
+        self.xnat.enter()
+        try:
+            self.respond(method)
+        finally:
+            self.xnat.leave()
+
+    def respond(self, method):
+        time.sleep(self.xnat.latency)
+        url = urlparse(self.path)
+        path = url.path.rstrip('/')
+        params = dict(parse_qsl(url.query))
+        nbytes = int(self.headers.get('Content-Length', 0) or 0)
+        if nbytes:
+            self.rfile.read(nbytes)
+        parts = path.split('/')
+        if path == '/data/JSESSION':
+            nbytes += self.reply(200, b'FAKESESSIONID', content_type='text/plain')
+        elif method == 'GET' and path == '/data/experiments':
+            nbytes += self.result_set(self.xnat.experiments(params))
+        elif method == 'GET' and len(parts) == 5 and parts[4] == 'scans':
+            rows = self.xnat.scans(parts[3], params)
+            if rows is None:
+                nbytes += self.reply(404)
+            else:
+                nbytes += self.result_set(rows)
+        elif method == 'PUT' and len(parts) == 10 and parts[8] == 'scans':
+            if self.xnat.update(parts[7], parts[9], params):
+                nbytes += self.reply(200)
+            else:
+                nbytes += self.reply(404)
+        else:
+            nbytes += self.reply(404)
+        self.xnat.count(method, path, nbytes)
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_PUT(self):
+        self.handle_request('PUT')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
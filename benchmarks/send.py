@@ -0,0 +1,131 @@
+#!/usr/bin/env python3 -u
+
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+import subprocess as sp
+from argparse import ArgumentParser
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import fake_scp
+
+logger = logging.getLogger('send')
+logging.basicConfig(level=logging.INFO)
+logging.getLogger('pynetdicom').setLevel(logging.WARNING)
+
+ROOT = os.path.dirname(here)
+SCRIPTS = os.path.join(ROOT, 'scripts')
+
+# run a script and write its peak resident memory in kB to a file on exit,
+# VmHWM starts over at exec unlike ru_maxrss which a child inherits from the
+# process that forked it
+PEAK = '''
+import sys
+import runpy
+output,sys.argv = sys.argv[1],sys.argv[2:]
+try:
+    runpy.run_path(sys.argv[0], run_name='__main__')
+finally:
+    with open('/proc/self/status') as fo:
+        peak = next(x.split()[1] for x in fo if x.startswith('VmHWM:'))
+    with open(output, 'w') as fo:
+        fo.write(peak)
+'''
+
+# xnat_dicom_send.py arguments for each send path
+MODES = {
+    'decode': ['--no-stream'],
+    'stream': []
+}
+
+def main():
+    parser = ArgumentParser(description='Measure peak memory and throughput of xnat_dicom_send.py against a local SCP')
+    parser.add_argument('--files', type=int, default=20,
+        help='Number of files in each synthetic corpus')
+    parser.add_argument('--frames', type=int, nargs='+', default=[8, 64],
+        help='Frames per file of each corpus, 256x256 16-bit frames are 128 KB each')
+    parser.add_argument('--modes', nargs='+', default=list(MODES), choices=list(MODES))
+    parser.add_argument('--budget', type=float, default=0.5,
+        help='Largest allowed growth in streaming peak memory from the smallest to the largest files, as a fraction of the largest file size')
+    parser.add_argument('-o', '--output-file',
+        help='Write results as JSON')
+    args = parser.parse_args()
+
+    results = dict()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for frames in sorted(args.frames):
+            directory = os.path.join(tmpdir, f'{frames}')
+            filenames = fake_scp.synthesize(directory, files=args.files, frames=frames)
+            size = os.path.getsize(filenames[0])
+            for mode in args.modes:
+                stats = run(mode, directory, tmpdir)
+                stats['file_size'] = size
+                results[f'{mode} {frames}'] = stats
+                logger.info(f'{mode:6s} {args.files} x {size / 1e6:.1f} MB: '
+                            f'{stats["files_per_second"]:.1f} files/s, '
+                            f'{stats["mb_per_second"]:.1f} MB/s, '
+                            f'peak RSS {stats["max_rss"] / 1e6:.1f} MB')
+                if stats['stored'] != args.files:
+                    logger.error(f'{mode} stored {stats["stored"]} of {args.files} files')
+                    sys.exit(1)
+
+    if args.output_file:
+        with open(args.output_file, 'w') as fo:
+            json.dump(results, fo, indent=2)
+
+    if 'stream' in args.modes and len(args.frames) > 1:
+        small = results[f'stream {min(args.frames)}']
+        large = results[f'stream {max(args.frames)}']
+        growth = large['max_rss'] - small['max_rss']
+        logger.info(f'streaming peak RSS grew {growth / 1e6:.1f} MB for files '
+                    f'{(large["file_size"] - small["file_size"]) / 1e6:.1f} MB larger')
+        if growth > args.budget * large['file_size']:
+            logger.error(f'streaming peak RSS grew by more than {args.budget:.0%} of the file size')
+            sys.exit(1)
+
+def run(mode, directory, tmpdir):
+    '''
+    Send a directory with xnat_dicom_send.py to a fresh local SCP and return
+    the throughput and the peak resident memory of the sending process.
+    '''
+    peak = os.path.join(tmpdir, 'peak')
+    scp = fake_scp.FakeScp().start()
+    try:
+        command = [
+            sys.executable, '-c', PEAK, peak,
+            os.path.join(SCRIPTS, 'xnat_dicom_send.py'),
+            '--project', 'BENCH',
+            '--subject', 'BENCH',
+            '--session', 'BENCH',
+            '--hostname', scp.host,
+            '--port', str(scp.port),
+            '--ae-title', scp.ae_title,
+            '--no-journal'
+        ] + MODES[mode] + [directory]
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([ROOT, env.get('PYTHONPATH', '')])
+        env['TMPDIR'] = tmpdir
+        start = time.monotonic()
+        sp.run(command, env=env, check=True, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+        wall = time.monotonic() - start
+    finally:
+        scp.stop()
+    with open(peak) as fo:
+        max_rss = int(fo.read()) * 1024
+    stats = scp.stats()
+    nbytes = sum(os.path.getsize(os.path.join(directory, x)) for x in os.listdir(directory))
+    return {
+        'stored': stats['stored'],
+        'wall': wall,
+        'files_per_second': stats['stored'] / wall,
+        'mb_per_second': nbytes / 1e6 / wall,
+        'max_rss': max_rss
+    }
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3 -u
+
+import os
+import sys
+import json
+import time
+import logging
+import statistics
+import subprocess as sp
+from argparse import ArgumentParser
+
+logger = logging.getLogger('startup')
+logging.basicConfig(level=logging.INFO)
+
+here = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(here)
+
+# dependencies that are expensive to import and must only be loaded by the
+# subcommands that use them
+HEAVY = (
+    'yaxil',
+    'requests',
+    'requests_cache',
+    'yaml',
+    'pydicom',
+    'pynetdicom'
+)
+
+# realta arguments to time, none of them should import a heavy dependency
+COMMANDS = (
+    ['--help'],
+    ['tag', '--help'],
+    ['audit', '--help'],
+    ['types', '--help'],
+    ['reconcile', '--help'],
+    ['set', '--help'],
+    ['send', '--help'],
+    ['upload', '--help']
+)
+
+# touch every lazily loaded dependency from many threads at once, the way
+# worker threads reach them first in realta send and realta set
+THREADED = '''
+import sys
+import threading
+import realta.dicom as dicom
+import realta.xnat as xnat
+import realta.tagger.rules as rules
+
+ATTRIBUTES = [
+    (dicom.pynetdicom, 'build_context'),
+    (dicom.pydicom, 'dcmread'),
+    (xnat.yaxil, 'scans'),
+    (xnat.requests, 'Session'),
+    (rules.yaml, 'SafeLoader')
+]
+barrier = threading.Barrier({threads})
+errors = list()
+
+def touch():
+    barrier.wait()
+    for module,attr in ATTRIBUTES:
+        try:
+            getattr(module, attr)
+        except Exception as e:
+            errors.append(f'{{module.__name__}}.{{attr}}: {{e!r}}')
+
+threads = [threading.Thread(target=touch) for _ in range({threads})]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+if errors:
+    print(errors[0])
+    sys.exit(1)
+'''
+
+def main():
+    parser = ArgumentParser(description='Measure realta command line startup time')
+    parser.add_argument('--repeat', type=int, default=5,
+        help='Number of runs of each command, the median is reported')
+    parser.add_argument('--budget', type=float, default=0.5,
+        help='Largest allowed ratio of command overhead to the overhead of importing every heavy dependency')
+    parser.add_argument('--threads', type=int, default=8,
+        help='Number of threads that race to use each lazily loaded dependency')
+    parser.add_argument('-o', '--output-file',
+        help='Write results as JSON')
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT, env.get('PYTHONPATH', '')])
+
+    # the interpreter alone, and the interpreter with every heavy dependency
+    # imported up front the way the scripts used to
+    floor = median([sys.executable, '-c', 'pass'], env, args.repeat)
+    eager = median([sys.executable, '-c', 'import ' + ', '.join(HEAVY)], env, args.repeat)
+    logger.info(f'interpreter startup {floor:.3f}s, eager imports {eager:.3f}s (+{eager - floor:.3f}s)')
+
+    results = {
+        'interpreter': floor,
+        'eager': eager,
+        'commands': dict()
+    }
+    failed = False
+    for command in COMMANDS:
+        argv = [sys.executable, '-m', 'realta.cli'] + command
+        name = ' '.join(['realta'] + command)
+        seconds = median(argv, env, args.repeat)
+        heavy = imported(argv, env)
+        ratio = (seconds - floor) / (eager - floor)
+        results['commands'][name] = {
+            'seconds': seconds,
+            'ratio': ratio,
+            'heavy': heavy
+        }
+        logger.info(f'{name:24s} {seconds:.3f}s (+{seconds - floor:.3f}s, {ratio:.0%} of eager)')
+        if heavy:
+            logger.error(f'{name} imported {", ".join(heavy)}')
+            failed = True
+        if ratio > args.budget:
+            logger.error(f'{name} overhead is over {args.budget:.0%} of eager imports')
+            failed = True
+
+    errors = threaded(env, args.threads, args.repeat)
+    results['threaded_errors'] = errors
+    if errors:
+        logger.error(f'{errors} of {args.repeat} threaded first uses of lazy dependencies failed')
+        failed = True
+    else:
+        logger.info(f'{args.repeat} threaded first uses of lazy dependencies with {args.threads} threads succeeded')
+
+    if args.output_file:
+        with open(args.output_file, 'w') as fo:
+            json.dump(results, fo, indent=2)
+    if failed:
+        sys.exit(1)
+
+def median(argv, env, repeat):
+    '''
+    Return the median wall time of running a command.
+    '''
+    times = list()
+    for _ in range(repeat):
+        start = time.monotonic()
+        sp.run(argv, env=env, check=True, stdout=sp.DEVNULL, stderr=sp.DEVNULL)
+        times.append(time.monotonic() - start)
+    return statistics.median(times)
+
+def threaded(env, threads, repeat):
+    '''
+    Return how many of repeat runs failed when several threads used the
+    lazily loaded dependencies for the first time at once.
+    '''
+    failed = 0
+    for _ in range(repeat):
+        proc = sp.run([sys.executable, '-c', THREADED.format(threads=threads)], env=env,
+                      stdout=sp.PIPE, stderr=sp.STDOUT, universal_newlines=True)
+        if proc.returncode:
+            logger.error(proc.stdout.strip().splitlines()[-1])
+            failed += 1
+    return failed
+
+def imported(argv, env):
+    '''
+    Return the heavy dependencies a command imports, using -X importtime.
+    '''
+    proc = sp.run([argv[0], '-X', 'importtime'] + argv[1:], env=env,
+                  stdout=sp.DEVNULL, stderr=sp.PIPE, universal_newlines=True)
+    found = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        module = line.rsplit('|', 1)[-1].strip()
+        if module in HEAVY:
+            found.add(module)
+    return sorted(found)
+
+if __name__ == '__main__':
+    main()
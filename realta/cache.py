@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+DIRECTORY = os.path.expanduser('~/.cache/realta')
+TTL = 3600
+MAX_ENTRIES = 10000
+# fraction of max_entries left after an eviction, so that the directory is
+# scanned again only after that many more writes
+EVICT_TO = 0.9
+
+class Cache:
+    '''
+    On-disk cache for XNAT scan and experiment listings.
+
+    Entries are grouped by session so that every entry for a session can be
+    invalidated at once after a write. Entries expire ttl seconds after they
+    were written and the least recently used entries are evicted once there
+    are more than max_entries. Writes are atomic.
+
+    The directory is only scanned for eviction on the first write and when
+    the entries counted at the last scan plus the writes since could be
+    more than max_entries, not on every write.
+    '''
+    def __init__(self, directory=DIRECTORY, ttl=TTL, max_entries=MAX_ENTRIES):
+        self.directory = os.path.expanduser(directory)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+        self._writes = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+
+    def _path(self, session, name):
+        filename = _prefix(session) + quote(name, safe='') + '.json'
+        return os.path.join(self.directory, filename)
+
+    def get(self, session, name):
+        '''
+        Return a cached value or None if it is missing or expired.
+        '''
+        path = self._path(session, name)
+        try:
+            mtime = os.stat(path).st_mtime
+            now = time.time()
+            if now - mtime > self.ttl:
+                logger.debug(f'cache expired {path}')
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path) as fo:
+                value = json.load(fo)
+            # record access time for LRU eviction, leaving mtime for the TTL
+            os.utime(path, (now, mtime))
+        except FileNotFoundError:
+            logger.debug(f'cache miss {path}')
+            self.misses += 1
+            return None
+        logger.debug(f'cache hit {path}')
+        self.hits += 1
+        return value
+
+    def set(self, session, name, value):
+        path = self._path(session, name)
+        fd,tmpfile = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fo:
+                json.dump(value, fo)
+            os.replace(tmpfile, path)
+        except BaseException:
+            os.remove(tmpfile)
+            raise
+        with self._lock:
+            self._writes += 1
+            full = self._entries is None or self._entries + self._writes > self.max_entries
+        if full:
+            self.evict()
+
+    def get_or_set(self, session, name, fetch):
+        '''
+        Return a cached value, or call fetch() and cache its result.
+        '''
+        value = self.get(session, name)
+        if value is None:
+            value = fetch()
+            self.set(session, name, value)
+        return value
+
+    def invalidate(self, session):
+        '''
+        Remove every cached entry for a session.
+        '''
+        invalidate(session, self.directory)
+
+    def evict(self):
+        '''
+        Remove the least recently used entries once there are more than
+        max_entries, leaving EVICT_TO of max_entries.
+        '''
+        with self._lock:
+            entries = list()
+            for entry in os.scandir(self.directory):
+                if entry.name.startswith('.tmp'):
+                    continue
+                try:
+                    entries.append((entry.stat().st_atime, entry.path))
+                except FileNotFoundError:
+                    pass
+            self._entries = len(entries)
+            self._writes = 0
+            if len(entries) <= self.max_entries:
+                return
+            excess = len(entries) - int(self.max_entries * EVICT_TO)
+            self._entries -= excess
+            for _,path in sorted(entries)[:excess]:
+                logger.debug(f'cache evict {path}')
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+def invalidate(session, directory=DIRECTORY):
+    '''
+    Remove every cached entry for a session from a cache directory, if it
+    exists. This is used after writes by commands that were not reading
+    through the cache, so that a later run with --cache is not stale.
+    '''
+    directory = os.path.expanduser(directory)
+    prefix = _prefix(session)
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        if entry.name.startswith(prefix):
+            logger.debug(f'cache invalidate {entry.path}')
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+def _prefix(session):
+    return quote(session, safe='') + '.'
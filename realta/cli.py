@@ -0,0 +1,41 @@
+import sys
+import importlib
+import collections as col
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from realta.__version__ import __version__
+
+# subcommand to (module, description), each module is only imported when
+# its subcommand is run
+COMMANDS = col.OrderedDict([
+    ('tag', ('realta.commands.tag', 'Tag scans in an MR Session using tags.yaml rules')),
+    ('audit', ('realta.commands.audit', 'Check scan tags for mismatches or ambiguities')),
+    ('types', ('realta.commands.types', 'Set scan types using a types.csv mapping')),
+    ('reconcile', ('realta.commands.reconcile', 'Set scan types and tags with one update per scan')),
+    ('set', ('realta.commands.set', 'Set scan note, type, or quality fields')),
+    ('send', ('realta.commands.send', 'Send DICOM files to a DICOM receiver')),
+    ('upload', ('realta.commands.upload', 'Upload files to session resource folders'))
+])
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    epilog = 'commands:\n' + '\n'.join(f'  {k:12s}{v[1]}' for k,v in iter(COMMANDS.items()))
+    parser = ArgumentParser(prog='realta',
+        usage='realta [-h] [--version] command [args ...]',
+        description='STAR data management tools',
+        epilog=epilog + '\n\nrun "realta command --help" for the arguments of a command',
+        formatter_class=RawDescriptionHelpFormatter)
+    parser.add_argument('--version', action='version', version=f'realta {__version__}')
+    parser.add_argument('command', choices=list(COMMANDS), metavar='command')
+    # parse the command on its own, everything after it belongs to the command
+    if not argv or argv[0].startswith('-'):
+        parser.parse_args(argv)
+        parser.error('the following arguments are required: command')
+    name,argv = argv[0],argv[1:]
+    parser.parse_args([name])
+    module,_ = COMMANDS[name]
+    command = importlib.import_module(module)
+    return command.main(argv, prog=f'realta {name}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+import os
+import sys
+import hashlib
+import logging
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+import realta.xnat as xnat
+import realta.cache as cache
+import realta.commands.common as common
+import realta.profiling as profiling
+from realta.state import State, Checkpoint
+from realta.tagger import Rules
+import realta.config as config
+
+logger = logging.getLogger('retag')
+logging.basicConfig(level=logging.INFO)
+
+STATE = os.path.join(cache.DIRECTORY, 'star_tag_audit.json')
+
+def main(argv=None, prog=None):
+    parser = ArgumentParser(prog=prog, description='Check XNAT scan tags for mismatches or ambiguities.')
+    parser.add_argument('--xnat', default='cbscentral')
+    parser.add_argument('--project')
+    parser.add_argument('--session')
+    parser.add_argument('--hide', action='store_true', help='Suppress NO_MATCH_FOUND and OK messages')
+    parser.add_argument('--filters', default=config.tags(),
+        help='Filters configuration file')
+    parser.add_argument('--jobs', type=int, default=1,
+        help='Number of experiments to fetch concurrently')
+    parser.add_argument('--state', default=STATE,
+        help='File used to remember results between runs with --since-last-run')
+    parser.add_argument('--since-last-run', action='store_true',
+        help='Only fetch scans for experiments that are new or changed since the last run')
+    parser.add_argument('-o', '--output-file',
+        help='Write CSV to this file instead of standard output')
+    parser.add_argument('--resume', action='store_true',
+        help='Resume an interrupted run, appending to --output-file')
+    common.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+    if args.resume and not args.output_file:
+        parser.error('--resume requires --output-file')
+
+    listings = common.setup(args)
+
+    rules = Rules.load(args.filters)
+    with profiling.span('auth'):
+        client = xnat.client(args.xnat, cache=listings)
+
+    # results from a previous run can only be reused if the rules are the same,
+    # state is only read and written by incremental audits
+    state,previous = None,dict()
+    if args.since_last_run:
+        state = State(args.state)
+        digest = checksum(args.filters)
+        if state.data.get('filters', None) != digest:
+            state.data = {
+                'filters': digest,
+                'experiments': dict()
+            }
+        previous = state.data['experiments']
+
+    with profiling.span('listing'):
+        experiments = client.experiments(label=args.session, project=args.project)
+    experiments = sorted(experiments, key=lambda x: (x.project, x.subject_label, x.label))
+    listed = experiments
+
+    # open output and skip experiments completed by an interrupted run
+    fo,checkpoint = sys.stdout,None
+    if args.output_file:
+        checkpoint = Checkpoint(f'{args.output_file}.checkpoint')
+        if not args.resume or not os.path.exists(args.output_file):
+            checkpoint.reset()
+            fo = open(args.output_file, 'w')
+        else:
+            logger.info(f'resuming after {len(checkpoint.done)} completed experiments')
+            fo = open(args.output_file, 'r+')
+            fo.seek(checkpoint.offset)
+            fo.truncate()
+        experiments = [x for x in experiments if x.id not in checkpoint.done]
+    modified = dict()
+    if state:
+        with profiling.span('listing'):
+            modified = client.last_modified(project=args.project, label=args.session)
+
+    def unchanged(experiment):
+        timestamp = modified.get(experiment.id, None)
+        item = previous.get(experiment.id, None)
+        return timestamp and item and item['last_modified'] == timestamp
+
+    # a cached listing for an experiment that changed since the last run may
+    # predate the change, and would be saved under the new timestamp
+    stale = [x for x in experiments if not unchanged(x)]
+    if listings:
+        for experiment in stale:
+            if experiment.id in previous:
+                client.invalidate(experiment.project, experiment.label)
+
+    # only fetch scans in bulk when enough of a project is stale
+    with profiling.span('listing'):
+        scan_listings = xnat.ScanListings(client, stale, listed=listed)
+
+    def fetch(experiment):
+        if unchanged(experiment):
+            logger.debug(f'{experiment.label} has not changed since last run')
+            return previous[experiment.id]['result']
+        with profiling.span('listing', experiment.label):
+            scans = scan_listings.scans(experiment)
+        with profiling.span('classify', experiment.label):
+            return gettags(scans, rules)
+
+    if not checkpoint or not checkpoint.offset:
+        print('Project,Subject,Session,Tag,Expected,Actual,Status', file=fo)
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        results = executor.map(fetch, experiments)
+        for experiment,result in zip(experiments, results):
+            previous[experiment.id] = {
+                'last_modified': modified.get(experiment.id, None),
+                'result': result
+            }
+            with profiling.span('plan', experiment.label):
+                for row in audit(experiment, result, hide=args.hide):
+                    print(','.join(row), file=fo)
+            fo.flush()
+            if checkpoint:
+                checkpoint.record(experiment.id, fo.tell())
+    if state:
+        state.save()
+    if checkpoint:
+        fo.close()
+        checkpoint.close()
+
+def checksum(filename):
+    with open(filename, 'rb') as fo:
+        return hashlib.sha256(fo.read()).hexdigest()
+
+def audit(experiment, result, hide=False):
+    project = experiment.project
+    subject = experiment.subject_label
+    session = experiment.label
+    for tag,item in iter(result['tags'].items()):
+        actual = item['actual']
+        actual_str = ';'.join(actual)
+        expected = item['expected']
+        expected_str = ';'.join(expected)
+        limit = item['limit']
+        row = [project, subject, session, tag, expected_str, actual_str]
+        if not expected:
+            if not hide:
+                yield row + ['NO_MATCH_FOUND']
+        elif len(expected) > limit:
+            if set(actual).issubset(set(expected)):
+                yield row + ['AMBIGUOUS(S)']
+            else:
+                yield row + ['AMBIGUOUS']
+        elif actual and expected != actual:
+            if len(actual) <= limit and set(expected).issubset(set(actual)):
+                yield row + ['MISMATCH(S)']
+            else:
+                yield row + ['MISMATCH']
+        elif not set(expected).difference(set(actual)):
+            if not hide:
+                yield row + ['OK']
+        else:
+            yield row + ['SET_TAG']
+
+def gettags(scans, rules):
+    result = {
+        'tags': dict()
+    }
+    for family in rules.families.values():
+        result['tags'][family.tag] = {
+            'limit': family.limit,
+            'actual': list(),
+            'expected': list()
+        }
+    for scan in scans:
+        scanid = scan['ID']
+        # expected
+        for name in rules.classify(scan):
+            tag = rules.families[name].tag
+            result['tags'][tag]['expected'].append(scanid)
+        # actual
+        found = set(x.family for x in rules.parse_note(scan['note']))
+        for name in rules.families:
+            if name in found:
+                tag = rules.families[name].tag
+                result['tags'][tag]['actual'].append(scanid)
+    return result
+
+if __name__ == '__main__':
+   main()
@@ -0,0 +1,40 @@
+import realta.cache as cache
+import realta.metrics as metrics
+import realta.profiling as profiling
+
+def add_arguments(parser, listings=True, profile=True):
+    '''
+    Add the --cache, --metrics, and --profile arguments shared by commands.
+    Commands that do not read XNAT listings or time their phases can leave
+    out the cache or profiling arguments.
+    '''
+    if listings:
+        parser.add_argument('--cache', action='store_true',
+            help='Cache scan and experiment listings')
+        parser.add_argument('--cache-dir', default=cache.DIRECTORY,
+            help='Cache directory')
+        parser.add_argument('--cache-ttl', type=int, default=cache.TTL,
+            help='Seconds before a cached listing expires')
+    parser.add_argument('--metrics',
+        help='Write HTTP request metrics as JSON to this file on exit')
+    if profile:
+        parser.add_argument('--profile', action='store_true',
+            help='Report time spent in each phase and the slowest sessions on exit')
+        parser.add_argument('--profile-top', type=int, default=profiling.TOP,
+            help='Number of slowest sessions to report with --profile')
+        parser.add_argument('--profile-output',
+            help='Write cProfile stats to this file with --profile')
+
+def setup(args):
+    '''
+    Create the listing cache and enable metrics and profiling for arguments
+    added by add_arguments. Returns the cache, or None without --cache.
+    '''
+    listings = None
+    if getattr(args, 'cache', False):
+        listings = cache.Cache(args.cache_dir, ttl=args.cache_ttl)
+    if args.metrics:
+        metrics.enable(args.metrics, cache=listings)
+    if getattr(args, 'profile', False):
+        profiling.enable(top=args.profile_top, filename=args.profile_output)
+    return listings
@@ -0,0 +1,118 @@
+import sys
+import logging
+import collections as col
+import realta.lazy as lazy
+import realta.xnat as xnat
+import realta.commands.common as common
+import realta.profiling as profiling
+import realta.config as config
+from realta.tagger import Tagger, Rules
+from realta.commands.types import read_mapping, compare
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+requests = lazy.load('requests')
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+def main(argv=None, prog=None):
+    parser = ArgumentParser(prog=prog, description='Set scan types and tags with one PUT per scan')
+    parser.add_argument('--xnat', default='cbscentral',
+        help='XNAT alias')
+    parser.add_argument('--project',
+        help='XNAT project')
+    parser.add_argument('--session',
+        help='Label of XNAT MR Session')
+    parser.add_argument('--filters', default=config.tags(),
+        help='Filters configuration file')
+    parser.add_argument('--mapping', default=config.types(),
+        help='Series description to scan type mapping file')
+    parser.add_argument('--jobs', type=int, default=4,
+        help='Number of concurrent updates')
+    parser.add_argument('--do-updates', action='store_true',
+        help='Execute updates')
+    common.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if not (args.project or args.session):
+        parser.error('provide --project, --session, or both')
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+
+    rules = Rules.load(args.filters)
+    mapping = read_mapping(args.mapping)
+
+    listings = common.setup(args)
+
+    with profiling.span('auth'):
+        client = xnat.client(args.xnat, pool_size=max(args.jobs, xnat.POOL_SIZE), cache=listings,
+                             cache_dir=args.cache_dir)
+
+    with profiling.span('listing'):
+        experiments = client.experiments(label=args.session, project=args.project)
+        scan_listings = xnat.ScanListings(client, experiments)
+
+    print('Project,Subject,Session,Scan,Field,Actual,Expected')
+    updates = col.OrderedDict()
+    for experiment in experiments:
+        project = experiment.project
+        subject = experiment.subject_label
+        session = experiment.label
+        with profiling.span('listing', session):
+            scans = scan_listings.scans(experiment)
+        for scan,fields in reconcile(args.xnat, experiment, scans, rules, mapping, cache=listings):
+            for field,(actual,expected) in iter(fields.items()):
+                print(f'{project},{subject},{session},{scan},{field},{actual},{expected}')
+            key = (project, subject, session, scan)
+            updates[key] = dict((k, v[1]) for k,v in iter(fields.items()))
+
+    logger.info(f'{sum(len(x) for x in updates.values())} field updates across '
+                f'{len(experiments)} sessions merged into {len(updates)} requests')
+    if not args.do_updates:
+        return
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = dict()
+        for key,fields in iter(updates.items()):
+            future = executor.submit(write, client, key, fields)
+            futures[future] = key
+        for future in as_completed(futures):
+            project,subject,session,scan = futures[future]
+            try:
+                future.result()
+            except (xnat.XnatError, requests.RequestException) as e:
+                logger.error(f'failed to update {session} scan {scan}: {e}')
+                failed += 1
+    logger.info(f'applied {len(updates) - failed}, failed {failed}')
+    if failed:
+        sys.exit(1)
+
+def reconcile(alias, experiment, scans, rules, mapping, cache=None):
+    '''
+    Evaluate the type mapping and compiled tag rules against one scan listing.
+    Returns a list of (scan, fields) where fields is a dictionary of field
+    to (actual, expected) for every field that needs to change.
+    '''
+    session = experiment.label
+    changes = col.OrderedDict()
+    with profiling.span('classify', session):
+        for scanid,_,actual,expected in compare(scans, mapping):
+            changes.setdefault(scanid, dict())['type'] = (actual, expected)
+    tagger = Tagger(alias, None, ['all'], session, project=experiment.project, cache=cache,
+                    rules=rules)
+    tagger.generate_updates(scans=scans)
+    with profiling.span('plan', session):
+        writes,_ = tagger.notes()
+        for scan,note in writes:
+            changes.setdefault(scan['id'], dict())['note'] = (scan['note'], note)
+    return list(changes.items())
+
+def write(client, key, fields):
+    project,subject,session,scan = key
+    with profiling.span('write', session):
+        return client.set_scan_fields(project, subject, session, scan, **fields)
+
+if __name__ == '__main__':
+    main()
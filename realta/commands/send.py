@@ -0,0 +1,249 @@
+import os
+import sys
+import csv
+import collections as col
+import logging
+import realta.lazy as lazy
+import realta.xnat as xnat
+import realta.dicom as dicom
+import realta.journal as journal
+import realta.commands.common as common
+from argparse import ArgumentParser
+
+yaxil = lazy.load('yaxil')
+
+logger = logging.getLogger('resend')
+logging.basicConfig(level=logging.INFO)
+
+def main(argv=None, prog=None):
+    parser = ArgumentParser(prog=prog)
+    parser.add_argument('--project')
+    parser.add_argument('--subject')
+    parser.add_argument('--session')
+    parser.add_argument('--batch',
+        help='CSV file of directory,project,subject,session rows to send in one run')
+    parser.add_argument('--hostname', default='cbscentral.rc.fas.harvard.edu')
+    parser.add_argument('--port', type=int, default=4444)
+    parser.add_argument('--ae-title', default='CBSCENTRAL')
+    parser.add_argument('--associations', type=int, default=1,
+        help='Number of concurrent associations')
+    parser.add_argument('--retries', type=int, default=1,
+        help='Number of times to retry failed files on a new association')
+    parser.add_argument('--no-stream', action='store_true',
+        help='Decode each file in memory instead of streaming it from disk')
+    parser.add_argument('--compress', action='store_true',
+        help='Re-encode uncompressed files with RLE Lossless when the receiver accepts it')
+    parser.add_argument('--allow-multiple-studies', action='store_true',
+        help='Send a directory even if it contains more than one StudyInstanceUID')
+    parser.add_argument('--journal', default=journal.FILENAME,
+        help='SQLite journal of files already stored, used to resume an interrupted send')
+    parser.add_argument('--no-journal', action='store_true',
+        help='Send every file, without reading or writing the journal')
+    parser.add_argument('--missing-only', action='store_true',
+        help='Only send series that have fewer files in the target session than on disk')
+    parser.add_argument('--target-xnat', default='cbscentral',
+        help='XNAT alias used to read the target session with --missing-only')
+    parser.add_argument('--download-xnat', default='cbscentral')
+    parser.add_argument('--download-project')
+    parser.add_argument('--download-session')
+    parser.add_argument('--pipeline', action='store_true',
+        help='Download one scan at a time and send each scan as soon as it arrives')
+    parser.add_argument('--download-jobs', type=int, default=2,
+        help='Number of scans to download concurrently with --pipeline')
+    parser.add_argument('--max-staged', type=int, default=4,
+        help='Maximum number of downloaded scans waiting to be sent with --pipeline, '
+             'this only bounds scans on disk with --delete-staged')
+    parser.add_argument('--delete-staged', action='store_true',
+        help='Delete downloaded scans once they have been sent with --pipeline')
+    common.add_arguments(parser, listings=False, profile=False)
+    parser.add_argument('dir', nargs='?')
+    args = parser.parse_args(argv)
+
+    common.setup(args)
+
+    if args.batch:
+        if args.pipeline or args.download_session:
+            parser.error('--batch cannot be used with --pipeline or --download-session')
+    elif not (args.project and args.subject and args.session and args.dir):
+        parser.error('provide --project, --subject, --session, and dir or --batch')
+    if args.associations < 1:
+        parser.error('--associations must be at least 1')
+    if args.pipeline and not args.download_session:
+        parser.error('--pipeline requires --download-session')
+    if args.download_jobs < 1 or args.max_staged < 1:
+        parser.error('--download-jobs and --max-staged must be at least 1')
+    if args.pipeline and args.missing_only:
+        parser.error('--missing-only cannot be used with --pipeline')
+
+    stores = None
+    if not args.no_journal:
+        destination = f'{args.ae_title}@{args.hostname}:{args.port}'
+        stores = journal.Journal(args.journal, destination)
+    sender = dicom.Sender(args.hostname, args.port, args.ae_title,
+        patient_comments(args.project, args.subject, args.session),
+        stream=not args.no_stream, journal=stores, compress=args.compress)
+
+    if args.batch:
+        batch(args, sender)
+        return
+
+    if args.pipeline:
+        client = xnat.client(args.download_xnat)
+        auth = client.auth
+        aid = yaxil.accession(auth, args.download_session, args.download_project)
+        def download(scan):
+            out_dir = os.path.join(args.dir, scan)
+            logger.info(f'downloading {args.download_session} scan {scan} from {auth.url} to {out_dir}')
+            yaxil.download(auth, label=args.download_session, aid=aid, scan_ids=[scan], out_dir=out_dir)
+            return out_dir
+        try:
+            results,failed_scans = dicom.pipeline(
+                sender,
+                client.scan_ids(aid),
+                download,
+                jobs=args.download_jobs,
+                max_staged=args.max_staged,
+                associations=args.associations,
+                retries=args.retries,
+                cleanup=args.delete_staged,
+                allow_multiple_studies=args.allow_multiple_studies
+            )
+        except dicom.MultipleStudiesError as e:
+            logger.critical(f'{args.download_session} contains more than one study, use --allow-multiple-studies to send anyway: {e}')
+            sys.exit(1)
+        failed = report(results, sender)
+        if failed_scans:
+            logger.error(f'failed to download scans {failed_scans}')
+        if failed or failed_scans:
+            sys.exit(1)
+        forget(sender.journal, [sender.comments])
+        return
+
+    if args.download_session:
+        auth = yaxil.auth(args.download_xnat)
+        logger.info(f'downloading {args.download_session} from {auth.url} to {args.dir}')
+        yaxil.download(
+            auth,
+            label=args.download_session,
+            project=args.download_project,
+            scan_ids=['ALL'],
+            out_dir=args.dir
+        )
+
+    logger.info(f'reading DICOM headers from {args.dir}')
+    entries = dicom.manifest(dicom.walk(args.dir))
+    if args.missing_only:
+        entries = missing(args.target_xnat, args.project, args.session, entries)
+    try:
+        results = dicom.send(
+            sender,
+            entries,
+            associations=args.associations,
+            retries=args.retries,
+            allow_multiple_studies=args.allow_multiple_studies
+        )
+    except dicom.MultipleStudiesError as e:
+        logger.critical(f'{args.dir} contains more than one study, use --allow-multiple-studies to send anyway: {e}')
+        sys.exit(1)
+    if report(results, sender):
+        sys.exit(1)
+    forget(sender.journal, [sender.comments])
+
+def batch(args, sender):
+    '''
+    Send every directory listed in a batch file to its own session, reusing
+    the same associations for all of them.
+    '''
+    try:
+        sender.echo()
+    except (dicom.AssociationError, dicom.EchoError) as e:
+        logger.critical(e)
+        sys.exit(1)
+    sessions = col.OrderedDict()
+    for row in read_batch(args.batch):
+        logger.info(f'reading DICOM headers from {row["directory"]}')
+        entries = dicom.manifest(dicom.walk(row['directory']))
+        if args.missing_only:
+            entries = missing(args.target_xnat, row['project'], row['session'], entries)
+        comments = patient_comments(row['project'], row['subject'], row['session'])
+        sessions.setdefault(comments, list()).extend(entries)
+    try:
+        results = dicom.send_batch(
+            sender,
+            sessions,
+            associations=args.associations,
+            retries=args.retries,
+            allow_multiple_studies=args.allow_multiple_studies
+        )
+    except dicom.MultipleStudiesError as e:
+        logger.critical(f'use --allow-multiple-studies to send anyway: {e}')
+        sys.exit(1)
+    failed = set(path for path,status in iter(results.items()) if status not in dicom.SUCCESS)
+    complete = [k for k,v in iter(sessions.items()) if not any(x.path in failed for x in v)]
+    forget(sender.journal, complete)
+    if report(results, sender):
+        sys.exit(1)
+
+def forget(stores, sessions):
+    '''
+    Clear the journal for sessions that were sent in full. The journal only
+    resumes interrupted sends, sending a session again later (e.g., after it
+    was deleted from XNAT) sends every file.
+    '''
+    if not stores:
+        return
+    for comments in sessions:
+        logger.debug(f'clearing journal for {comments}')
+        stores.clear(comments)
+
+def read_batch(filename):
+    '''
+    Read directory,project,subject,session rows from a CSV file with a
+    header row.
+    '''
+    with open(filename) as fo:
+        for row in csv.DictReader(fo):
+            yield {
+                'directory': row['directory'],
+                'project': row['project'],
+                'subject': row['subject'],
+                'session': row['session']
+            }
+
+def patient_comments(project, subject, session):
+    return f'Project:{project},Subject:{subject},Session:{session} AA:true'
+
+def missing(alias, project, session, entries):
+    '''
+    Return the entries from every series that the target session does not
+    have all files for.
+    '''
+    client = xnat.client(alias)
+    try:
+        experiments = client.experiments(label=session, project=project)
+    except yaxil.exceptions.NoExperimentsError:
+        experiments = list()
+    if not experiments:
+        logger.info(f'{session} is not in {project}, sending every file')
+        return entries
+    archived = client.series_files(experiments[0].id)
+    result = dicom.missing(entries, archived)
+    logger.info(f'{session} is missing {len(result)} of {len(entries)} files '
+                f'({sum(x.size for x in result) / 1e6:.1f} MB)')
+    return result
+
+def report(results, sender):
+    summary = dicom.summarize(results)
+    failed = sum(n for status,n in iter(summary.items()) if status not in dicom.SUCCESS)
+    for status,n in sorted(summary.items(), key=lambda x: (x[0] is None, x[0] or 0)):
+        status = 'not sent' if status is None else f'0x{status:04X}'
+        logger.info(f'C-STORE status {status}: {n} files')
+    logger.info(f'sent {len(results) - failed} of {len(results)} files, {failed} failed')
+    if sender.original_bytes:
+        ratio = sender.wire_bytes / sender.original_bytes
+        logger.info(f'sent {sender.wire_bytes / 1e6:.1f} MB on the wire for '
+                    f'{sender.original_bytes / 1e6:.1f} MB of files ({ratio:.0%})')
+    return failed
+
+if __name__ == '__main__':
+    main()
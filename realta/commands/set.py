@@ -0,0 +1,141 @@
+import os
+import sys
+import csv
+import json
+import logging
+import collections as col
+import realta.lazy as lazy
+import realta.xnat as xnat
+import realta.commands.common as common
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+requests = lazy.load('requests')
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+QUALITY = ['usable', 'questionable', 'unusable']
+
+def main(argv=None, prog=None):
+    parser = ArgumentParser(prog=prog)
+    parser.add_argument('--xnat', default='cbscentral')
+    parser.add_argument('--project')
+    parser.add_argument('--session')
+    parser.add_argument('--scan')
+    parser.add_argument('--field', choices=list(xnat.FIELDS))
+    parser.add_argument('--value')
+    parser.add_argument('--manifest',
+        help='CSV or JSONL file of session,scan,field,value rows (and optional project)')
+    parser.add_argument('--jobs', type=int, default=4,
+        help='Number of concurrent updates when using --manifest')
+    parser.add_argument('--do-updates', action='store_true')
+    common.add_arguments(parser, profile=False)
+    args = parser.parse_args(argv)
+
+    if args.manifest:
+        rows = list(read_manifest(args.manifest))
+    elif args.session and args.scan and args.field and args.value is not None:
+        rows = [{
+            'project': args.project,
+            'session': args.session,
+            'scan': args.scan,
+            'field': args.field,
+            'value': args.value
+        }]
+    else:
+        parser.error('provide --session, --scan, --field, and --value or --manifest')
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+
+    for row in rows:
+        if row['field'] not in xnat.FIELDS:
+            logger.critical(f'unsupported field {row["field"]}, must be one of {list(xnat.FIELDS)}')
+            sys.exit(1)
+        if row['field'] == 'quality' and row['value'] not in QUALITY:
+            logger.critical(f'when using --field quality, value must be one of {QUALITY}')
+            sys.exit(1)
+
+    listings = common.setup(args)
+
+    client = xnat.client(args.xnat, pool_size=max(args.jobs, xnat.POOL_SIZE), cache=listings,
+                         cache_dir=args.cache_dir)
+    updates = plan(client, rows, default_project=args.project)
+
+    sessions = set(x[:3] for x in updates)
+    logger.info(f'{len(rows)} field updates across {len(sessions)} sessions merged into {len(updates)} requests')
+    for (project,subject,session,scan),fields in iter(updates.items()):
+        logger.info(f'setting {fields} for {session} scan {scan}')
+    if not args.do_updates:
+        return
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = dict()
+        for key,fields in iter(updates.items()):
+            future = executor.submit(client.set_scan_fields, *key, **fields)
+            futures[future] = key
+        for future in as_completed(futures):
+            project,subject,session,scan = futures[future]
+            try:
+                future.result()
+            except (xnat.XnatError, requests.RequestException) as e:
+                logger.error(f'failed to update {session} scan {scan}: {e}')
+                failed += 1
+    logger.info(f'applied {len(updates) - failed}, failed {failed}')
+    if failed:
+        sys.exit(1)
+
+def read_manifest(filename):
+    '''
+    Read update rows from a CSV file (with a header row) or a JSON Lines file.
+    '''
+    _,ext = os.path.splitext(filename)
+    with open(filename) as fo:
+        if ext.lower() in ('.jsonl', '.json'):
+            reader = (json.loads(line) for line in fo if line.strip())
+        else:
+            reader = csv.DictReader(fo)
+        for row in reader:
+            yield {
+                'project': row.get('project', None) or None,
+                'session': row['session'],
+                'scan': str(row['scan']),
+                'field': row['field'],
+                'value': row['value']
+            }
+
+def plan(client, rows, default_project=None):
+    '''
+    Resolve every distinct session once and merge all field updates for the
+    same scan into a single set of fields.
+    '''
+    experiments = dict()
+    updates = col.OrderedDict()
+    for row in rows:
+        key = (row['project'] or default_project, row['session'])
+        if key not in experiments:
+            experiments[key] = resolve(client, *key)
+        experiment = experiments[key]
+        scan = (experiment.project, experiment.subject_label, experiment.label, row['scan'])
+        fields = updates.setdefault(scan, dict())
+        field,value = row['field'],row['value']
+        if field in fields and fields[field] != value:
+            raise ConflictingUpdateError(f'found conflicting values for {field} on {row["session"]} scan {row["scan"]}')
+        fields[field] = value
+    return updates
+
+def resolve(client, project, session):
+    experiments = client.experiments(label=session, project=project)
+    if len(experiments) > 1:
+        raise TooManyExperimentsError(f'found too many experiments with label {session}, use --project')
+    return experiments.pop()
+
+class TooManyExperimentsError(Exception):
+    pass
+
+class ConflictingUpdateError(Exception):
+    pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import os
+import re
+import sys
+import json
+import string
+import logging
+import collections
+import argparse as ap
+from io import StringIO
+from realta.tagger import Tagger
+import realta.lazy as lazy
+import realta.commands.common as common
+import realta.config as config 
+
+yaml = lazy.load('yaml')
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+def main(argv=None, prog=None):
+    parser = ap.ArgumentParser(prog=prog)
+    parser.add_argument('--xnat', default='cbscentral',
+        help='XNAT alias')
+    parser.add_argument('--project',
+        help='XNAT project')
+    parser.add_argument('--session', required=True,
+        help='Label of XNAT MR Session')
+    parser.add_argument('-o', '--output-file',
+        help='Output summary of updates')
+    parser.add_argument('--filters', default=config.tags(),
+        help='Filters configuration file') 
+    parser.add_argument('--confirm', action='store_true',
+        help='Prompt user to confirm every update')
+    parser.add_argument('--do-updates', action='store_true',
+        help='Execute updates')
+    parser.add_argument('--jobs', type=int, default=4,
+        help='Number of concurrent updates')
+    common.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.jobs < 1:
+        parser.error('--jobs must be at least 1')
+
+    yaml.add_representer(collections.defaultdict, yaml.representer.Representer.represent_dict)
+    with open(args.filters) as fo:
+        filters = yaml.load(fo, Loader=yaml.SafeLoader)
+
+    listings = common.setup(args)
+
+    tagger = Tagger(args.xnat, filters, ['all'], args.session, cache=listings, jobs=args.jobs,
+                    cache_dir=args.cache_dir)
+    tagger.generate_updates()
+
+    if args.output_file:
+        with open(args.output_file, 'w') as fo:
+            js = json.dumps(tagger.updates, indent=2)
+            fo.write(js)
+    if args.do_updates:
+        summary = tagger.apply_updates()
+        if summary['failed']:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
+
@@ -0,0 +1,86 @@
+import csv
+import logging
+import realta.xnat as xnat
+import realta.commands.common as common
+import realta.profiling as profiling
+import realta.config as config
+from argparse import ArgumentParser
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=logging.INFO)
+
+def main(argv=None, prog=None):
+    parser = ArgumentParser(prog=prog, description='Set scan types')
+    parser.add_argument('--xnat', default='cbscentral')
+    parser.add_argument('--project')
+    parser.add_argument('--session')
+    parser.add_argument('--mapping', default=config.types())
+    parser.add_argument('--do-updates', action='store_true')
+    common.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    listings = common.setup(args)
+
+    with profiling.span('auth'):
+        client = xnat.client(args.xnat, cache=listings, cache_dir=args.cache_dir)
+    print(args.mapping)
+    mapping = read_mapping(args.mapping)
+
+    with profiling.span('listing'):
+        experiments = client.experiments(label=args.session, project=args.project)
+        scan_listings = xnat.ScanListings(client, experiments)
+
+    print('Project,Subject,Session,Scan,Series_Description,Type,Expected')
+    for experiment in experiments:
+        project = experiment.project
+        subject = experiment.subject_label
+        session = experiment.label
+        with profiling.span('listing', session):
+            scans = scan_listings.scans(experiment)
+        with profiling.span('classify', session):
+            changes = compare(scans, mapping)
+        for scanid,key,actual,expected in changes:
+            print(f'{project},{subject},{session},{scanid},{key},{actual},{expected}')
+        if args.do_updates:
+            with profiling.span('write', session):
+                for scanid,_,_,expected in changes:
+                    settype(client, experiment, scanid, expected)
+
+def read_mapping(filename):
+    '''
+    Read a types.csv file into a dictionary of series description to scan
+    type.
+    '''
+    mapping = dict()
+    with open(filename) as fo:
+        reader = csv.DictReader(fo)
+        for row in reader:
+            key = row['Series Description']
+            value =  row['Type']
+            if key in mapping and mapping[key] != value:
+                raise Exception(f'found multiple instances of "{key}" with differing rename values')
+            mapping[key] = value
+    return mapping
+
+def compare(scans, mapping):
+    '''
+    Return (scan, series description, actual type, expected type) for every
+    scan whose type does not match the mapping.
+    '''
+    changes = list()
+    for scan in scans:
+        key = scan['series_description']
+        if key not in mapping:
+            continue
+        if scan['type'] != mapping[key]:
+            changes.append((scan['ID'], key, scan['type'], mapping[key]))
+    return changes
+
+def settype(client, experiment, scanid, scan_type):
+    project = experiment.project
+    subject = experiment.subject_label
+    session = experiment.label
+    client.set_scan_fields(project, subject, session, scanid, type=scan_type)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+import os
+import sys
+import csv
+import logging
+import zipfile
+import tempfile
+import collections as col
+import realta.lazy as lazy
+import realta.xnat as xnat
+import realta.commands.common as common
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+yaxil = lazy.load('yaxil')
+requests = lazy.load('requests')
+
+logger = logging.getLogger('uploader')
+logging.basicConfig(level=logging.INFO)
+
+Upload = col.namedtuple('Upload', ['filename', 'project', 'subject', 'session', 'folder', 'name'])
+
+def main(argv=None, prog=None):
+    parser = ArgumentParser(prog=prog)
+    parser.add_argument('--xnat', default='cbscentral')
+    parser.add_argument('--project')
+    parser.add_argument('--subject')
+    parser.add_argument('--session', default='TestSession02')
+    parser.add_argument('--folder', default='behavioral_task_data',
+        help='Desired resource folder name')
+    parser.add_argument('--name',
+        help='Desired Resource file name')
+    parser.add_argument('--confirm', action='store_true')
+    parser.add_argument('--force', action='store_true',
+        help='Upload even if an identical file is already in the folder')
+    parser.add_argument('--manifest',
+        help='CSV file of file,project,subject,session,folder,name rows to upload in one run')
+    parser.add_argument('--tree', action='store_true',
+        help='Treat the file argument as a directory with one sub-directory of files per session')
+    parser.add_argument('--jobs', type=int, default=4,
+        help='Number of concurrent uploads when using --manifest or --tree')
+    parser.add_argument('--zip', action='store_true',
+        help='Upload the files for each session and folder as one zip archive for the server to extract')
+    common.add_arguments(parser, listings=False, profile=False)
+    parser.add_argument('file', nargs='?')
+    args = parser.parse_args(argv)
+
+    common.setup(args)
+
+    if args.manifest or args.tree:
+        if args.tree and not (args.project and args.file):
+            parser.error('--tree requires --project and a directory')
+        if args.jobs < 1:
+            parser.error('--jobs must be at least 1')
+        ingest(args)
+        return
+    if not (args.project and args.subject and args.file):
+        parser.error('provide --project, --subject, and file, or --manifest or --tree')
+
+    client = xnat.client(args.xnat)
+    aid = yaxil.accession(client.auth, args.session, args.project)
+
+    # create folder and get resource
+    folder = getresource(client, aid, args.folder)
+    if not folder:
+        logger.info(f'creating folder {args.folder}')
+        putresource(client, aid, args.folder, confirm=args.confirm)
+        folder = getresource(client, aid, args.folder)
+
+    # upload file to resource folder
+    if not args.name:
+        args.name = os.path.basename(args.file)
+    upload(client, aid, folder, args.file, args.name, confirm=args.confirm, force=args.force)
+
+def ingest(args):
+    '''
+    Upload many files across many sessions. Accession IDs, resource folders,
+    and folder listings are looked up once per session, then files are
+    uploaded concurrently over the same pooled connection.
+    '''
+    if args.manifest:
+        uploads = list(read_manifest(args.manifest, args.folder))
+    else:
+        uploads = list(walk_tree(args.file, args.project, args.subject, args.folder))
+    client = xnat.client(args.xnat, pool_size=max(args.jobs, xnat.POOL_SIZE))
+    index = Index(client, confirm=args.confirm)
+
+    batches = col.OrderedDict()
+    for item in uploads:
+        aid = index.accession(item.project, item.session)
+        resource = index.resource(aid, item.folder)
+        if not args.force and xnat.unchanged(item.filename, index.file(aid, resource, item.name)):
+            logger.info(f'{item.name} in {item.session} folder {item.folder} is unchanged, skipping')
+            continue
+        batches.setdefault((aid, item.folder), list()).append(item)
+    pending = sum(len(x) for x in batches.values())
+    logger.info(f'uploading {pending} of {len(uploads)} files to {len(batches)} folders')
+    if args.confirm and pending:
+        input('press enter to continue')
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = dict()
+        for (aid,folder),items in iter(batches.items()):
+            resource = index.resource(aid, folder)
+            if args.zip:
+                future = executor.submit(upload_zip, client, aid, resource, items)
+                futures[future] = items
+                continue
+            for item in items:
+                future = executor.submit(client.upload, aid, resource, item.filename, item.name)
+                futures[future] = [item]
+        for future in as_completed(futures):
+            items = futures[future]
+            try:
+                future.result()
+            except (xnat.XnatError, requests.RequestException) as e:
+                logger.error(f'failed to upload {[x.filename for x in items]}: {e}')
+                failed += len(items)
+    logger.info(f'uploaded {pending - failed} files, skipped {len(uploads) - pending}, failed {failed}')
+    if failed:
+        sys.exit(1)
+
+def upload_zip(client, aid, resource, items):
+    '''
+    Pack files into a temporary zip archive and upload it with a single
+    request for the server to extract into the resource.
+    '''
+    with tempfile.NamedTemporaryFile(suffix='.zip') as tmp:
+        with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for item in items:
+                archive.write(item.filename, arcname=item.name)
+        tmp.flush()
+        name = f'{resource["label"]}.zip'
+        logger.info(f'uploading {len(items)} files to {aid} resource {resource["label"]} as {name}')
+        return client.upload(aid, resource, tmp.name, name, extract=True)
+
+class Index:
+    '''
+    In-run index of accession IDs, resource folders, and folder listings,
+    so each is requested at most once per session. Missing folders are
+    created on first use.
+    '''
+    def __init__(self, client, confirm=False):
+        self.client = client
+        self.confirm = confirm
+        self._accessions = dict()
+        self._resources = dict()
+        self._files = dict()
+
+    def accession(self, project, session):
+        key = (project, session)
+        if key not in self._accessions:
+            self._accessions[key] = yaxil.accession(self.client.auth, session, project)
+        return self._accessions[key]
+
+    def resource(self, aid, folder):
+        if aid not in self._resources:
+            self._resources[aid] = dict((x['label'], x) for x in self.client.resources(aid))
+        resources = self._resources[aid]
+        if folder not in resources:
+            logger.info(f'creating folder {folder}')
+            putresource(self.client, aid, folder, confirm=self.confirm)
+            resources[folder] = getresource(self.client, aid, folder)
+            # a new folder has no files
+            self._files[(aid, folder)] = dict()
+        return resources[folder]
+
+    def file(self, aid, resource, name):
+        key = (aid, resource['label'])
+        if key not in self._files:
+            self._files[key] = dict((x['Name'], x) for x in self.client.files(aid, resource))
+        return self._files[key].get(name, None)
+
+def read_manifest(filename, default_folder):
+    '''
+    Read file,project,subject,session,folder,name rows from a CSV file with
+    a header row. The folder and name columns are optional.
+    '''
+    with open(filename) as fo:
+        for row in csv.DictReader(fo):
+            yield Upload(
+                filename=row['file'],
+                project=row['project'],
+                subject=row.get('subject', None),
+                session=row['session'],
+                folder=row.get('folder', None) or default_folder,
+                name=row.get('name', None) or os.path.basename(row['file'])
+            )
+
+def walk_tree(directory, project, subject, folder):
+    '''
+    Yield an Upload for every file in a directory laid out as
+    <directory>/<session>/<file>.
+    '''
+    for session in sorted(os.listdir(directory)):
+        path = os.path.join(directory, session)
+        if not os.path.isdir(path):
+            continue
+        for f in sorted(os.listdir(path)):
+            filename = os.path.join(path, f)
+            if os.path.isfile(filename):
+                yield Upload(filename, project, subject, session, folder, f)
+
+def upload(client, aid, resource, filename, name, confirm=False, force=False):
+    '''
+    Upload a file unless an identical file (same size and MD5 digest) with
+    the same name is already in the resource. Returns True if the file was
+    uploaded.
+    '''
+    if not force and xnat.unchanged(filename, client.file(aid, resource, name)):
+        logger.info(f'{name} in {aid} resource {resource["label"]} is identical to {filename}, skipping')
+        return False
+    logger.info(f'uploading {filename} to {aid} resource {resource["label"]} as {name}')
+    if confirm:
+        input('press enter to continue')
+    client.upload(aid, resource, filename, name)
+    return True
+
+def putresource(client, aid, label, confirm=False):
+    logger.info(f'creating resource {label} for {aid}')
+    if confirm:
+        input('press enter to continue')
+    client.put_resource(aid, label)
+
+def getresource(client, aid, label):
+    return client.resource(aid, label)
+
+if __name__ == '__main__':
+    main()
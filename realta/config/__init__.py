@@ -1,5 +1,4 @@
 import os
-import yaml
 
 __dir__ = os.path.dirname(__file__)
 
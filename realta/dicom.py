@@ -0,0 +1,561 @@
+import os
+import time
+import queue
+import shutil
+import logging
+import tempfile
+import threading
+import collections as col
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import realta.lazy as lazy
+
+pydicom = lazy.load('pydicom')
+pynetdicom = lazy.load('pynetdicom')
+
+logger = logging.getLogger(__name__)
+
+# C-STORE success and warning statuses, both mean the instance was stored
+SUCCESS = (0x0000, 0xB000, 0xB006, 0xB007)
+
+# an association can propose at most 128 presentation contexts
+MAX_CONTEXTS = 128
+
+# P-DATA PDUs a streamed C-STORE may queue ahead of the network, each one is
+# at most the maximum PDU size of the receiver
+MAX_QUEUED_PDUS = 64
+
+Entry = col.namedtuple('Entry', [
+    'path',
+    'sop_class_uid',
+    'sop_instance_uid',
+    'transfer_syntax',
+    'study_uid',
+    'series_uid',
+    'size',
+    'image'
+])
+
+def walk(directory):
+    '''
+    Yield every file under a directory in os.walk order.
+    '''
+    for root,dirs,files in os.walk(directory):
+        for f in files:
+            yield os.path.join(root, f)
+
+def manifest(files):
+    '''
+    Read the header of every DICOM file, stopping before the pixel data, and
+    return a list of Entry. Non-DICOM files are skipped. A file is taken to
+    be an image when it has Rows, which every image with Pixel Data has and
+    non-image objects (e.g., SR or Phoenix reports) do not.
+    '''
+    tags = ['SOPClassUID', 'SOPInstanceUID', 'StudyInstanceUID', 'SeriesInstanceUID', 'Rows']
+    entries = list()
+    for path in files:
+        try:
+            ds = pydicom.dcmread(path, stop_before_pixels=True, specific_tags=tags)
+        except pydicom.errors.InvalidDicomError:
+            logger.info(f'skipping non-dicom {path}')
+            continue
+        entries.append(Entry(
+            path=path,
+            sop_class_uid=ds.get('SOPClassUID', None),
+            sop_instance_uid=ds.get('SOPInstanceUID', None),
+            transfer_syntax=ds.file_meta.get('TransferSyntaxUID', None),
+            study_uid=ds.get('StudyInstanceUID', None),
+            series_uid=ds.get('SeriesInstanceUID', None),
+            size=os.path.getsize(path),
+            image='Rows' in ds
+        ))
+    return entries
+
+def contexts(entries, compress=False):
+    '''
+    Build only the presentation contexts needed to send a list of entries.
+    Each SOP Class is proposed once per transfer syntax found in the files,
+    so they can be streamed as-is, and once with the uncompressed syntaxes
+    as a fallback. When compress is True, each SOP Class with images is also
+    proposed with RLE Lossless.
+    '''
+    syntaxes = col.OrderedDict()
+    images = set()
+    for entry in entries:
+        syntaxes.setdefault(entry.sop_class_uid, set()).add(entry.transfer_syntax)
+        if entry.image:
+            images.add(entry.sop_class_uid)
+    result = list()
+    for sop_class,found in iter(syntaxes.items()):
+        for tsyntax in sorted(x for x in found if x):
+            result.append(pynetdicom.build_context(sop_class, [tsyntax]))
+        result.append(pynetdicom.build_context(sop_class, [
+            pydicom.uid.ExplicitVRLittleEndian,
+            pydicom.uid.ImplicitVRLittleEndian
+        ]))
+        if compress and sop_class in images and pydicom.uid.RLELossless not in found:
+            result.append(pynetdicom.build_context(sop_class, [pydicom.uid.RLELossless]))
+    if len(result) > MAX_CONTEXTS:
+        raise ContextError(f'{len(result)} presentation contexts are needed, '
+                           f'an association allows at most {MAX_CONTEXTS}')
+    return result
+
+def missing(entries, archived):
+    '''
+    Return the entries from every series that has fewer files in archived,
+    a dictionary of SeriesInstanceUID to file count, than it has locally.
+    '''
+    local = col.Counter(x.series_uid for x in entries)
+    incomplete = set(uid for uid,n in iter(local.items()) if archived.get(uid, 0) < n)
+    return [x for x in entries if x.series_uid in incomplete]
+
+def partition(entries, n, key='series_uid'):
+    '''
+    Distribute entries across n batches, keeping entries that share a key
+    together. Largest groups by size go first, always into the batch with
+    the fewest bytes.
+    '''
+    groups = col.OrderedDict()
+    for entry in entries:
+        groups.setdefault(getattr(entry, key), list()).append(entry)
+    batches = [list() for _ in range(n)]
+    sizes = [0] * n
+    for group in sorted(groups.values(), key=lambda x: sum(e.size for e in x), reverse=True):
+        i = sizes.index(min(sizes))
+        batches[i].extend(group)
+        sizes[i] += sum(e.size for e in group)
+    return [x for x in batches if x]
+
+def rewrite(src, dst, **elements):
+    '''
+    Copy a DICOM file from src to the file object dst, replacing header
+    elements along the way. Only the header is decoded and re-encoded, the
+    pixel data and anything after it is copied as raw bytes.
+    '''
+    with open(src, 'rb') as fo:
+        ds = pydicom.dcmread(fo, stop_before_pixels=True)
+        tsyntax = ds.file_meta.get('TransferSyntaxUID', None)
+        if tsyntax in (None, pydicom.uid.DeflatedExplicitVRLittleEndian):
+            raise StreamError(f'cannot stream {src} with transfer syntax {tsyntax}')
+        for keyword,value in iter(elements.items()):
+            setattr(ds, keyword, value)
+        ds.save_as(dst)
+        shutil.copyfileobj(fo, dst)
+    dst.flush()
+
+class Progress:
+    '''
+    Thread safe progress and ETA reporting for a known list of entries.
+    '''
+    def __init__(self, entries, interval=10):
+        self.files = len(entries)
+        self.total = sum(x.size for x in entries)
+        self.interval = interval
+        self.done = 0
+        self.bytes = 0
+        self.start = time.monotonic()
+        self._last = self.start
+        self._lock = threading.Lock()
+
+    def update(self, entry):
+        with self._lock:
+            self.done += 1
+            self.bytes += entry.size
+            now = time.monotonic()
+            if now - self._last < self.interval and self.done < self.files:
+                return
+            self._last = now
+            elapsed = now - self.start
+            rate = self.bytes / elapsed if elapsed else 0
+            eta = (self.total - self.bytes) / rate if rate else 0
+            logger.info(f'sent {self.done}/{self.files} files, '
+                        f'{self.bytes / 1e6:.1f}/{self.total / 1e6:.1f} MB '
+                        f'at {rate / 1e6:.1f} MB/s, ETA {eta:.0f}s')
+
+class Backlog(queue.Queue):
+    '''
+    Outgoing PDU queue of an association that makes the sending thread wait
+    once maxsize PDUs are queued, so a file is read no faster than it goes
+    out. It stops waiting once the association's DUL thread has exited,
+    since nothing would ever drain it.
+    '''
+    def __init__(self, dul, maxsize):
+        super().__init__(maxsize)
+        self.dul = dul
+
+    def put(self, item, block=True, timeout=None):
+        while block and self.dul.is_alive():
+            try:
+                return super().put(item, timeout=0.1)
+            except queue.Full:
+                pass
+        with self.mutex:
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+class Sender:
+    '''
+    Send DICOM files to a storage SCP, rewriting PatientComments so that
+    XNAT will auto-archive them into the desired Project, Subject, and
+    Session.
+
+    By default each file is streamed to the SCP with only the header
+    rewritten, so memory use does not depend on the size of the file. A
+    file is decoded and sent from memory instead when stream=False, when
+    no accepted presentation context exactly matches its transfer syntax,
+    or when the installed pynetdicom lacks the internals streaming uses.
+
+    When compress=True, uncompressed files are re-encoded with RLE Lossless
+    whenever the SCP accepted RLE Lossless for their SOP Class, otherwise
+    they are sent as above. The original and on the wire sizes of every
+    file sent are added up in original_bytes and wire_bytes.
+
+    When a journal is given, the status of every file is recorded against
+    its SOPInstanceUID as soon as it is known.
+    '''
+    def __init__(self, hostname, port, ae_title, comments, stream=True, tmpdir=None,
+                 journal=None, compress=False):
+        self.hostname = hostname
+        self.port = port
+        self.ae_title = ae_title
+        self.comments = comments
+        self.stream = stream
+        self.tmpdir = tmpdir
+        self.journal = journal
+        self.compress = compress
+        self.original_bytes = 0
+        self.wire_bytes = 0
+        self._lock = threading.Lock()
+        if stream and not hasattr(pynetdicom._config, 'STORE_SEND_CHUNKED_DATASET'):
+            logger.warning(f'pynetdicom {pynetdicom.__version__} cannot stream files, '
+                           'decoding them in memory instead')
+            self.stream = False
+        if self.stream:
+            pynetdicom._config.STORE_SEND_CHUNKED_DATASET = True
+
+    def associate(self, contexts):
+        ae = pynetdicom.AE()
+        ae.requested_contexts = contexts
+        assoc = ae.associate(self.hostname, self.port, ae_title=self.ae_title)
+        if not assoc.is_established:
+            raise AssociationError(f'association with {self.ae_title}@{self.hostname}:{self.port} '
+                                    'rejected, aborted or never connected')
+        if self.stream and not isinstance(getattr(assoc.dul, 'to_provider_queue', None), queue.Queue):
+            logger.warning(f'pynetdicom {pynetdicom.__version__} has no outgoing PDU queue to '
+                           'bound, decoding files in memory instead')
+            self.stream = False
+        if self.stream:
+            # pynetdicom reads a streamed file into its outgoing queue as fast
+            # as the disk allows, which holds the whole file in memory
+            backlog = Backlog(assoc.dul, MAX_QUEUED_PDUS)
+            backlog.queue.extend(assoc.dul.to_provider_queue.queue)
+            assoc.dul.to_provider_queue = backlog
+        return assoc
+
+    def store(self, assoc, entry, comments=None):
+        '''
+        Send the file for a manifest Entry over an established association
+        and return the C-STORE status. PatientComments defaults to the
+        sender's comments.
+        '''
+        comments = comments or self.comments
+        path = entry.path
+        if self.compress and self._compressible(assoc, entry):
+            try:
+                return self._store_compressed(assoc, path, comments)
+            except CompressError as e:
+                logger.debug(e)
+        if self.stream:
+            with tempfile.NamedTemporaryFile(dir=self.tmpdir, suffix='.dcm') as tmp:
+                try:
+                    rewrite(path, tmp, PatientComments=comments)
+                    status = self._status(assoc.send_c_store(tmp.name))
+                    self._count(path, tmp.tell(), status)
+                    return status
+                except StreamError as e:
+                    logger.debug(e)
+                except ValueError as e:
+                    # a streamed dataset can't be converted to another transfer
+                    # syntax, so it needs an exactly matching accepted context
+                    logger.debug(f'cannot stream {path}: {e}')
+        ds = pydicom.dcmread(path)
+        ds.PatientComments = comments
+        status = self._status(assoc.send_c_store(ds))
+        self._count(path, os.path.getsize(path), status)
+        return status
+
+    def _compressible(self, assoc, entry):
+        '''
+        Check from the manifest alone, without reading the file, that a file
+        is an uncompressed image and that RLE Lossless was accepted for its
+        SOP Class.
+        '''
+        if not entry.image:
+            logger.debug(f'{entry.path} is not an image')
+            return False
+        tsyntax = entry.transfer_syntax
+        if not tsyntax or pydicom.uid.UID(tsyntax).is_compressed:
+            logger.debug(f'{entry.path} is already compressed with {tsyntax}')
+            return False
+        if not self._accepted(assoc, entry.sop_class_uid, pydicom.uid.RLELossless):
+            logger.debug(f'RLE Lossless was not accepted for {entry.sop_class_uid}')
+            return False
+        return True
+
+    def _store_compressed(self, assoc, path, comments):
+        ds = pydicom.dcmread(path)
+        if 'PixelData' not in ds:
+            raise CompressError(f'{path} has no Pixel Data to compress')
+        ds.PatientComments = comments
+        # any encoder failure falls back to sending the file as it is
+        try:
+            ds.compress(pydicom.uid.RLELossless)
+        except Exception as e:
+            raise CompressError(f'cannot compress {path}: {e}')
+        with tempfile.NamedTemporaryFile(dir=self.tmpdir, suffix='.dcm') as tmp:
+            ds.save_as(tmp, enforce_file_format=True)
+            tmp.flush()
+            status = self._status(assoc.send_c_store(tmp.name))
+            self._count(path, tmp.tell(), status)
+            return status
+
+    def _accepted(self, assoc, sop_class, tsyntax):
+        for cx in assoc.accepted_contexts:
+            if cx.abstract_syntax == sop_class and tsyntax in cx.transfer_syntax:
+                return True
+        return False
+
+    def _count(self, path, wire, status):
+        '''
+        Add the sizes of a file that was stored, files that failed are not
+        counted.
+        '''
+        if status not in SUCCESS:
+            return
+        with self._lock:
+            self.original_bytes += os.path.getsize(path)
+            self.wire_bytes += wire
+
+    def _status(self, status):
+        if not status:
+            raise StoreError('Connection timed out, was aborted or received invalid response')
+        return status.Status
+
+    def send(self, sessions, progress=None):
+        '''
+        Send entries for one or more sessions, a dictionary of PatientComments
+        to entries, over a single association that proposes only the
+        presentation contexts they need. Returns a dictionary of file to
+        C-STORE status, with None for files that could not be sent.
+        '''
+        entries = [x for batch in sessions.values() for x in batch]
+        results = col.OrderedDict((x.path, None) for x in entries)
+        try:
+            assoc = self.associate(contexts(entries, compress=self.compress))
+        except AssociationError as e:
+            logger.error(e)
+            return results
+        try:
+            for comments,batch in iter(sessions.items()):
+                for entry in batch:
+                    logger.debug(f'sending {entry.path}')
+                    try:
+                        results[entry.path] = self.store(assoc, entry, comments)
+                        logger.debug(f'C-STORE status: {results[entry.path]}')
+                    except (StoreError, ValueError) as e:
+                        logger.error(f'failed to send {entry.path}: {e}')
+                    finally:
+                        if self.journal:
+                            self.journal.record(comments, entry.sop_instance_uid, entry.path,
+                                                results[entry.path])
+                    if progress:
+                        progress.update(entry)
+                    if not assoc.is_established:
+                        return results
+        finally:
+            assoc.release()
+        return results
+
+    def echo(self):
+        '''
+        Check that the SCP is reachable and answers a C-ECHO.
+        '''
+        assoc = self.associate([pynetdicom.build_context(pynetdicom.sop_class.Verification)])
+        try:
+            status = assoc.send_c_echo()
+        finally:
+            assoc.release()
+        if not status or status.Status != 0x0000:
+            raise EchoError(f'C-ECHO to {self.ae_title}@{self.hostname}:{self.port} failed')
+
+def send(sender, entries, associations=1, retries=1, allow_multiple_studies=False):
+    '''
+    Send entries from a manifest to the sender's session. See send_batch.
+    '''
+    sessions = {sender.comments: entries}
+    return send_batch(sender, sessions, associations=associations, retries=retries,
+                      allow_multiple_studies=allow_multiple_studies)
+
+def send_batch(sender, sessions, associations=1, retries=1, allow_multiple_studies=False):
+    '''
+    Send entries for many sessions, a dictionary of PatientComments to
+    entries, across a number of concurrent associations. Each association
+    is reused for every session assigned to it and each series is kept on a
+    single association. Files that fail are retried on a fresh association.
+    Returns a dictionary of file to C-STORE status.
+
+    A session with entries from more than one study is refused before
+    anything is sent, unless allow_multiple_studies is True. When the sender
+    has a journal, entries it records as already stored are skipped and
+    left out of the results.
+    '''
+    routes = dict()
+    pending = list()
+    for comments,entries in iter(sessions.items()):
+        studies = set(x.study_uid for x in entries)
+        if len(studies) > 1 and not allow_multiple_studies:
+            raise MultipleStudiesError(f'{comments} has {len(studies)} StudyInstanceUIDs '
+                                       f'{sorted(map(str, studies))}')
+        if sender.journal:
+            statuses = sender.journal.statuses(comments)
+            stored = [x for x in entries if statuses.get(x.sop_instance_uid, None) in SUCCESS]
+            if stored:
+                logger.info(f'skipping {len(stored)} files for {comments} already stored according to the journal')
+                entries = [x for x in entries if statuses.get(x.sop_instance_uid, None) not in SUCCESS]
+        for entry in entries:
+            routes[entry.path] = comments
+        pending.extend(entries)
+    if not pending:
+        return col.OrderedDict()
+
+    def route(entries):
+        result = col.OrderedDict()
+        for entry in entries:
+            result.setdefault(routes[entry.path], list()).append(entry)
+        return result
+
+    logger.info(f'sending {len(pending)} files ({sum(x.size for x in pending) / 1e6:.1f} MB) '
+                f'for {len(sessions)} sessions over {associations} associations')
+    progress = Progress(pending)
+    batches = [route(x) for x in partition(pending, associations)]
+    results = col.OrderedDict()
+    with ThreadPoolExecutor(max_workers=associations) as executor:
+        for batch in executor.map(lambda x: sender.send(x, progress), batches):
+            results.update(batch)
+    for attempt in range(retries):
+        failed = [x for x in pending if results[x.path] not in SUCCESS]
+        if not failed:
+            break
+        logger.warning(f'retrying {len(failed)} files on a new association (attempt {attempt + 1})')
+        results.update(sender.send(route(failed)))
+    return results
+
+def pipeline(sender, items, fetch, jobs=2, max_staged=4, associations=1,
+             retries=1, cleanup=False, allow_multiple_studies=False):
+    '''
+    Fetch items (e.g., scans) into staging directories concurrently and send
+    the files for each item as soon as it has been fetched, so that fetching
+    and sending overlap. fetch(item) must return the staging directory.
+
+    No more than max_staged items are being fetched or waiting to be sent at
+    once, an item's slot is freed as soon as it has been sent. When cleanup
+    is True, a staging directory is removed after all of its files were
+    stored, so only then does max_staged also bound the items on disk, apart
+    from items with files that failed to send which are left in place.
+    Returns a tuple of (results, items that could not be fetched).
+
+    Every item is sent with the same PatientComments, so the StudyInstanceUIDs
+    seen so far are tracked across items. Unless allow_multiple_studies is
+    True, the first item that brings in a second study stops the pipeline:
+    it is not sent, no more items are fetched or sent, and
+    MultipleStudiesError is raised once the workers have stopped.
+    '''
+    staged = threading.BoundedSemaphore(max_staged)
+    results = col.OrderedDict()
+    failed = list()
+    studies = set()
+    stopped = list()
+
+    def stage(item):
+        staged.acquire()
+        if stopped:
+            staged.release()
+            raise MultipleStudiesError('pipeline stopped')
+        try:
+            return fetch(item)
+        except BaseException:
+            staged.release()
+            raise
+
+    def finish(directory):
+        try:
+            if stopped:
+                return col.OrderedDict()
+            entries = manifest(walk(directory))
+            found = studies | set(x.study_uid for x in entries)
+            if len(found) > 1 and not allow_multiple_studies:
+                stopped.append(f'{directory} would add StudyInstanceUIDs '
+                               f'{sorted(map(str, found - studies))} to a session with '
+                               f'{sorted(map(str, studies)) or "none"}')
+                logger.error(f'refusing to send {directory}, stopping: {stopped[0]}')
+                return col.OrderedDict()
+            studies.update(found)
+            batch = send(sender, entries, associations=associations, retries=retries,
+                         allow_multiple_studies=allow_multiple_studies)
+            if cleanup and all(x in SUCCESS for x in batch.values()):
+                logger.info(f'removing {directory}')
+                shutil.rmtree(directory)
+            return batch
+        finally:
+            staged.release()
+
+    with ThreadPoolExecutor(max_workers=jobs) as fetches, \
+         ThreadPoolExecutor(max_workers=1) as sends:
+        futures = dict((fetches.submit(stage, item), item) for item in items)
+        pending = list()
+        for future in as_completed(futures):
+            item = futures[future]
+            if stopped:
+                future.cancel()
+                continue
+            try:
+                directory = future.result()
+            except Exception as e:
+                logger.error(f'failed to fetch {item}: {e}')
+                failed.append(item)
+                continue
+            logger.info(f'{item} is ready to send from {directory}')
+            pending.append(sends.submit(finish, directory))
+        for future in pending:
+            results.update(future.result())
+    if stopped:
+        sent = sum(1 for x in results.values() if x in SUCCESS)
+        raise MultipleStudiesError(f'{stopped[0]}, stopped after sending {sent} files')
+    return results,failed
+
+def summarize(results):
+    '''
+    Count C-STORE statuses, with None for files that could not be sent.
+    '''
+    return col.Counter(results.values())
+
+class AssociationError(Exception):
+    pass
+
+class CompressError(Exception):
+    pass
+
+class ContextError(Exception):
+    pass
+
+class EchoError(Exception):
+    pass
+
+class MultipleStudiesError(Exception):
+    pass
+
+class StoreError(Exception):
+    pass
+
+class StreamError(Exception):
+    pass
@@ -0,0 +1,78 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+FILENAME = os.path.expanduser('~/.cache/realta/journal.sqlite')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS stores (
+    destination TEXT NOT NULL,
+    session TEXT NOT NULL,
+    sop_instance_uid TEXT NOT NULL,
+    path TEXT,
+    status INTEGER,
+    updated REAL NOT NULL,
+    PRIMARY KEY (destination, session, sop_instance_uid)
+)
+'''
+
+class Journal:
+    '''
+    SQLite record of the C-STORE status of every SOPInstanceUID sent to a
+    destination, kept separately for each session.
+
+    Each status is committed as soon as it is recorded, so a send that dies
+    partway through can be resumed by skipping the instances that were
+    already stored. Once a session has been sent in full its statuses should
+    be cleared, so that a later send of the same session sends every file.
+    '''
+    def __init__(self, filename, destination):
+        self.filename = filename
+        self.destination = destination
+        self._lock = threading.Lock()
+        dirname = os.path.dirname(os.path.abspath(filename))
+        os.makedirs(dirname, exist_ok=True)
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(SCHEMA)
+        self._conn.commit()
+
+    def statuses(self, session):
+        '''
+        Return a dictionary of SOPInstanceUID to the last recorded status
+        for a session.
+        '''
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT sop_instance_uid, status FROM stores WHERE destination = ? AND session = ?',
+                (self.destination, session)
+            )
+            return dict(rows.fetchall())
+
+    def record(self, session, sop_instance_uid, path, status):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO stores VALUES (?, ?, ?, ?, ?, ?)',
+                (self.destination, session, sop_instance_uid, path, status, time.time())
+            )
+            self._conn.commit()
+
+    def clear(self, session):
+        '''
+        Forget every status recorded for a session.
+        '''
+        with self._lock:
+            self._conn.execute(
+                'DELETE FROM stores WHERE destination = ? AND session = ?',
+                (self.destination, session)
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
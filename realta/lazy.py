@@ -0,0 +1,45 @@
+import sys
+import types
+import threading
+import importlib
+import importlib.util
+
+_lock = threading.RLock()
+
+def load(name):
+    '''
+    Return a module that is not imported until one of its attributes is
+    first used. Heavy dependencies (yaxil, requests, pydicom, pynetdicom,
+    yaml) are loaded this way so that commands only pay for what they use
+    and --help stays fast.
+    '''
+    if name in sys.modules:
+        return sys.modules[name]
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f'No module named {name!r}', name=name)
+    return LazyModule(name)
+
+class LazyModule(types.ModuleType):
+    '''
+    Stand-in for a module that imports it on first attribute access. The
+    import is done under a lock, so threads that race to use the module
+    first all wait for it to be fully initialized.
+    '''
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def _load(self):
+        module = self.__dict__.get('_module', None)
+        if module is None:
+            # a module in sys.modules may still be initializing in another
+            # thread, so the first use always waits on the import
+            with _lock:
+                module = importlib.import_module(self.__name__)
+            types.ModuleType.__setattr__(self, '_module', module)
+        return module
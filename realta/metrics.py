@@ -0,0 +1,160 @@
+import json
+import time
+import atexit
+import logging
+import threading
+import collections as col
+from urllib.parse import urlparse
+import realta.lazy as lazy
+
+requests = lazy.load('requests')
+
+logger = logging.getLogger(__name__)
+
+# path segments that are followed by an ID in XNAT REST URLs
+COLLECTIONS = (
+    'projects',
+    'subjects',
+    'experiments',
+    'scans',
+    'resources',
+    'files',
+    'assessors'
+)
+
+# upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+_metrics = None
+_lock = threading.Lock()
+
+def endpoint(method, url):
+    '''
+    Reduce a request to its method and path with every ID replaced by the
+    name of its collection, e.g. GET /data/experiments/{experiment}/scans.
+    '''
+    parts = urlparse(url).path.rstrip('/').split('/')
+    for i in range(1, len(parts)):
+        if parts[i - 1] in COLLECTIONS and parts[i]:
+            parts[i] = '{' + parts[i - 1].rstrip('s') + '}'
+    return f'{method} {"/".join(parts)}'
+
+def enable(filename=None, cache=None):
+    '''
+    Start recording every HTTP request made through requests, including
+    requests made by yaxil, and return the Metrics. When filename is given,
+    a summary is written to it as JSON when the process exits. Hits and
+    misses of a realta.cache.Cache are included in the summary.
+    '''
+    global _metrics
+    with _lock:
+        if not _metrics:
+            _metrics = Metrics()
+            _patch(_metrics)
+        if cache:
+            _metrics.cache = cache
+    if filename:
+        atexit.register(_metrics.write, filename)
+    return _metrics
+
+def _patch(metrics):
+    send = requests.Session.send
+    def timed(self, request, **kwargs):
+        start = time.monotonic()
+        try:
+            response = send(self, request, **kwargs)
+        except requests.RequestException as e:
+            metrics.record(request, None, time.monotonic() - start, error=type(e).__name__)
+            raise
+        metrics.record(request, response, time.monotonic() - start)
+        return response
+    requests.Session.send = timed
+
+class Metrics:
+    '''
+    Per-endpoint request counts, latency histograms, response sizes, and
+    status codes.
+    '''
+    def __init__(self):
+        self.endpoints = dict()
+        self.cache = None
+        self.start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, request, response, elapsed, error=None):
+        key = endpoint(request.method, request.url)
+        size = 0
+        status = error
+        if response is not None:
+            status = response.status_code
+            # streamed responses have not been read yet
+            if not response.raw or response._content_consumed:
+                size = len(response.content or b'')
+            else:
+                size = int(response.headers.get('Content-Length', 0) or 0)
+        with self._lock:
+            item = self.endpoints.get(key, None)
+            if not item:
+                item = self.endpoints[key] = {
+                    'requests': 0,
+                    'seconds': 0.0,
+                    'max_seconds': 0.0,
+                    'bytes': 0,
+                    'status': col.Counter(),
+                    'latencies': list()
+                }
+            item['requests'] += 1
+            item['seconds'] += elapsed
+            item['max_seconds'] = max(item['max_seconds'], elapsed)
+            item['bytes'] += size
+            item['status'][str(status)] += 1
+            item['latencies'].append(elapsed)
+
+    def summary(self):
+        with self._lock:
+            endpoints = dict()
+            for key,item in sorted(self.endpoints.items()):
+                latencies = sorted(item['latencies'])
+                histogram = col.OrderedDict((str(x), 0) for x in BUCKETS)
+                for latency in latencies:
+                    bucket = next(x for x in BUCKETS if latency <= x)
+                    histogram[str(bucket)] += 1
+                endpoints[key] = {
+                    'requests': item['requests'],
+                    'seconds': round(item['seconds'], 6),
+                    'mean_seconds': round(item['seconds'] / item['requests'], 6),
+                    'p50_seconds': round(percentile(latencies, 0.50), 6),
+                    'p95_seconds': round(percentile(latencies, 0.95), 6),
+                    'max_seconds': round(item['max_seconds'], 6),
+                    'bytes': item['bytes'],
+                    'status': dict(item['status']),
+                    'histogram': histogram
+                }
+        result = {
+            'wall_seconds': round(time.monotonic() - self.start, 6),
+            'requests': sum(x['requests'] for x in endpoints.values()),
+            'bytes': sum(x['bytes'] for x in endpoints.values()),
+            'endpoints': endpoints
+        }
+        if self.cache:
+            lookups = self.cache.hits + self.cache.misses
+            result['cache'] = {
+                'hits': self.cache.hits,
+                'misses': self.cache.misses,
+                'hit_ratio': round(self.cache.hits / lookups, 6) if lookups else None
+            }
+        return result
+
+    def write(self, filename):
+        summary = self.summary()
+        logger.info(f'writing metrics for {summary["requests"]} requests to {filename}')
+        with open(filename, 'w') as fo:
+            json.dump(summary, fo, indent=2)
+
+def percentile(values, q):
+    '''
+    Return the q-th quantile of sorted values, or 0 if there are none.
+    '''
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
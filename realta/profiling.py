@@ -0,0 +1,153 @@
+import time
+import atexit
+import pstats
+import logging
+import cProfile
+import threading
+import contextlib
+import collections as col
+
+logger = logging.getLogger(__name__)
+
+TOP = 10
+
+class Profiler:
+    '''
+    Nested wall time spans for the logical phases of a run (e.g., auth,
+    listing, classify, plan, write), grouped by session.
+
+    A span inherits the session of the span it is nested in, so phases can
+    be attributed to a session without passing it around. Spans are no-ops
+    until the profiler is enabled. When cProfile is requested, every thread
+    is profiled while it is inside a span, and the main thread is profiled
+    from the moment the profiler is enabled.
+    '''
+    def __init__(self):
+        self.enabled = False
+        self.spans = col.defaultdict(lambda: [0, 0.0])
+        self._profiles = list()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cprofile = False
+
+    def enable(self, cprofile=False):
+        self.enabled = True
+        self._cprofile = cprofile
+        if cprofile:
+            # the main thread is profiled for the rest of the run
+            self._thread_profile().enable()
+            self._local.always = True
+
+    def _thread_profile(self):
+        profile = getattr(self._local, 'profile', None)
+        if not profile:
+            profile = self._local.profile = cProfile.Profile()
+            with self._lock:
+                self._profiles.append(profile)
+        return profile
+
+    @contextlib.contextmanager
+    def span(self, name, session=None):
+        if not self.enabled:
+            yield
+            return
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = list()
+        if session is None and stack:
+            session = stack[-1][1]
+        profile = None
+        if self._cprofile and not stack and not getattr(self._local, 'always', False):
+            profile = self._thread_profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # newer Pythons profile every thread from the main thread
+                profile = None
+        stack.append((name, session))
+        path = '/'.join(x[0] for x in stack)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            stack.pop()
+            if profile:
+                profile.disable()
+            with self._lock:
+                item = self.spans[(session, path)]
+                item[0] += 1
+                item[1] += elapsed
+
+    def sessions(self):
+        '''
+        Return a list of (session, total seconds, dictionary of span path to
+        seconds) sorted from slowest to fastest. Only top level spans count
+        towards the total.
+        '''
+        result = dict()
+        with self._lock:
+            for (session,path),(count,seconds) in iter(self.spans.items()):
+                if session is None:
+                    continue
+                item = result.setdefault(session, [0.0, dict()])
+                item[1][path] = seconds
+                if '/' not in path:
+                    item[0] += seconds
+        return sorted(((k, v[0], v[1]) for k,v in iter(result.items())),
+                      key=lambda x: x[1], reverse=True)
+
+    def phases(self):
+        '''
+        Return a dictionary of span path to (count, seconds) across all
+        sessions.
+        '''
+        result = col.defaultdict(lambda: [0, 0.0])
+        with self._lock:
+            for (session,path),(count,seconds) in iter(self.spans.items()):
+                result[path][0] += count
+                result[path][1] += seconds
+        return dict(result)
+
+    def report(self, top=TOP):
+        for path,(count,seconds) in sorted(self.phases().items()):
+            logger.info(f'phase {path}: {seconds:.3f}s over {count} spans')
+        sessions = self.sessions()
+        if sessions:
+            logger.info(f'top {min(top, len(sessions))} slowest of {len(sessions)} sessions')
+        for rank,(session,total,phases) in enumerate(sessions[:top], start=1):
+            breakdown = ', '.join(f'{k} {v:.3f}s' for k,v in sorted(phases.items()))
+            logger.info(f'{rank:3d}. {session} {total:.3f}s ({breakdown})')
+
+    def dump(self, filename):
+        '''
+        Combine the cProfile data from every thread into one pstats file.
+        '''
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return
+        for profile in profiles:
+            profile.disable()
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        stats.dump_stats(filename)
+        logger.info(f'saved cProfile stats to {filename}')
+
+profiler = Profiler()
+span = profiler.span
+
+def enable(top=TOP, filename=None):
+    '''
+    Enable the shared profiler and report the slowest sessions when the
+    process exits. When filename is given, cProfile data is written to it
+    as a pstats file.
+    '''
+    profiler.enable(cprofile=bool(filename))
+    def finish():
+        profiler.report(top=top)
+        if filename:
+            profiler.dump(filename)
+    atexit.register(finish)
+    return profiler
@@ -0,0 +1,74 @@
+import os
+import json
+import logging
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+class State:
+    '''
+    Small JSON document persisted between runs of a script.
+
+    The document is read once when the object is created and written back
+    atomically by save(), so an interrupted run never leaves a truncated
+    state file behind.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.data = dict()
+        if os.path.exists(filename):
+            logger.info(f'reading state from {filename}')
+            with open(filename) as fo:
+                self.data = json.load(fo)
+
+    def save(self):
+        dirname = os.path.dirname(os.path.abspath(self.filename))
+        os.makedirs(dirname, exist_ok=True)
+        fd,tmpfile = tempfile.mkstemp(dir=dirname, prefix='.state')
+        try:
+            with os.fdopen(fd, 'w') as fo:
+                json.dump(self.data, fo)
+                fo.flush()
+                os.fsync(fo.fileno())
+            os.replace(tmpfile, self.filename)
+        except BaseException:
+            os.remove(tmpfile)
+            raise
+
+class Checkpoint:
+    '''
+    Append-only record of completed work items.
+
+    Each line holds an item ID and the size of the output file once that
+    item was written, so a resumed run can skip completed items and
+    discard any partial output written after the last checkpoint.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.done = dict()
+        self.offset = 0
+        if os.path.exists(filename):
+            with open(filename) as fo:
+                for line in fo:
+                    # a partially written last line is ignored
+                    if not line.endswith('\n'):
+                        break
+                    item,offset = line.rstrip('\n').rsplit(' ', 1)
+                    self.done[item] = int(offset)
+                    self.offset = int(offset)
+        self._fo = open(filename, 'a')
+
+    def reset(self):
+        self.done = dict()
+        self.offset = 0
+        self._fo.truncate(0)
+
+    def record(self, item, offset):
+        self._fo.write(f'{item} {offset}\n')
+        self._fo.flush()
+        os.fsync(self._fo.fileno())
+        self.done[item] = offset
+        self.offset = offset
+
+    def close(self):
+        self._fo.close()
@@ -2,239 +2,135 @@ import os
 import re
 import sys
 import json
-import yaxil
 import logging
-import requests
-from yaxil.exceptions import NoExperimentsError
+import collections as col
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import realta.lazy as lazy
+import realta.xnat as xnat
+from realta.xnat import XnatError
+from realta.tagger.rules import Rules
+from realta.profiling import span
+
+requests = lazy.load('requests')
 
 logger = logging.getLogger()
 
 class Tagger:
-    def __init__(self, alias, filters, target, session, project=None, cache=None):
-        self.auth = yaxil.auth(alias)
+    '''
+    Plan and apply tag updates for one session. The filters are compiled
+    into Rules, unless Rules that were already compiled are passed in to be
+    shared across many sessions.
+    '''
+    def __init__(self, alias, filters, target, session, project=None, cache=None, jobs=1,
+                 rules=None, cache_dir=None):
+        with span('auth', session):
+            self.xnat = xnat.client(alias, pool_size=max(jobs, xnat.POOL_SIZE), cache=cache,
+                                    cache_dir=cache_dir)
+        self.auth = self.xnat.auth
+        self.jobs = jobs
         self.filters = filters
+        self.rules = rules if rules is not None else Rules(filters)
         self.project = project
         self.cache = cache
         self.target = target 
         self.session = session
         self.updates = dict()
 
-    def generate_updates(self):
-        self.get_scan_listing()
-        self.updates.update({
-            'move_t1w_abcd': self.move_t1w_abcd(self.scans),
-            'anat_t1w_abcd': self.anat_t1w_abcd(self.scans),
-            'move_t2w_abcd': self.move_t2w_abcd(self.scans),
-            'anat_t2w_abcd': self.anat_t2w_abcd(self.scans),
-            'move_t1w_gsp': self.move_t1w_gsp(self.scans),
-            'anat_t1w_gsp': self.anat_t1w_gsp(self.scans),
-            'move_t2w_gsp': self.move_t2w_gsp(self.scans),
-            'anat_t2w_gsp': self.anat_t2w_gsp(self.scans),
-        })
+    def generate_updates(self, scans=None):
+        '''
+        Plan tag updates for every scan in the session. A scan listing that
+        was already fetched can be passed in to avoid fetching it again.
+        '''
+        if scans is not None:
+            self.scans = scans
+        else:
+            with span('listing', self.session):
+                self.get_scan_listing()
+        with span('classify', self.session):
+            matches = self.rules.assign(self.scans)
+        with span('plan', self.session):
+            for name,scans in iter(matches.items()):
+                tag = self.rules.families[name].tag
+                self.updates[name] = self.plan(tag, scans)
 
     def apply_updates(self):
-        self.upsert()
+        with span('write', self.session):
+            return self.upsert()
 
     def filter(self, modality):
-        matches = []
-        filt = self.filters[modality]
-        for scan in self.scans:
-            if scan['quality'] != 'usable':
-                continue
-            image_type = scan.get('image_type', None)
-            if isinstance(image_type, str):
-                scan['image_type'] = re.split('\\\+', scan['image_type'])
-            for f in filt:
-                match = True
-                for key,value in iter(f.items()):
-                    if key in scan and scan[key] != value:
-                        match = False
-                if match:
-                    matches.append(scan)
-        return matches
-
-    def move_t1w_abcd(self, scans):
-        updates = list()
-        scans = self.filter('move_t1w_abcd')
-        for i,scan in enumerate(scans, start=1):
-            sid = scan['id']
-            session = scan['session_label']
-            series = scan['series_description'].strip()
-            note = scan['note'].strip()
-            tag = f'MOVE_T1w_ABCD_{i}'
-            updates.append({
-                'project': scan['session_project'],
-                'subject': scan['subject_label'],
-                'session': session, 
-                'scan': sid,
-                'series_description': series,
-                'note': note,
-                'tag': tag
-            })
-        return updates
-
-    def anat_t1w_abcd(self, scans):
-        updates = list()
-        scans = self.filter('anat_t1w_abcd')
-        for i,scan in enumerate(scans, start=1):
-            sid = scan['id']
-            session = scan['session_label']
-            series = scan['series_description'].strip()
-            note = scan['note'].strip()
-            tag = f'ANAT_T1w_ABCD_{i}'
-            updates.append({
-                'project': scan['session_project'],
-                'subject': scan['subject_label'],
-                'session': session, 
-                'scan': sid,
-                'series_description': series,
-                'note': note,
-                'tag': tag
-            })
-        return updates
+        return self.rules.assign(self.scans)[modality]
 
-    def move_t2w_abcd(self, scans):
+    def plan(self, tag, scans):
         updates = list()
-        scans = self.filter('move_t2w_abcd')
         for i,scan in enumerate(scans, start=1):
-            sid = scan['id']
-            session = scan['session_label']
-            series = scan['series_description'].strip()
-            note = scan['note'].strip()
-            tag = f'MOVE_T2w_ABCD_{i}'
             updates.append({
                 'project': scan['session_project'],
                 'subject': scan['subject_label'],
-                'session': session, 
-                'scan': sid,
-                'series_description': series,
-                'note': note,
-                'tag': tag
-            })
-        return updates
-
-    def anat_t2w_abcd(self, scans):
-        updates = list()
-        scans = self.filter('anat_t2w_abcd')
-        for i,scan in enumerate(scans, start=1):
-            sid = scan['id']
-            session = scan['session_label']
-            series = scan['series_description'].strip()
-            note = scan['note'].strip()
-            tag = f'ANAT_T2w_ABCD_{i}'
-            updates.append({
-                'project': scan['session_project'],
-                'subject': scan['subject_label'],
-                'session': session, 
-                'scan': sid,
-                'series_description': series,
-                'note': note,
-                'tag': tag
-            })
-        return updates
-
-    def move_t1w_gsp(self, scans):
-        updates = list()
-        scans = self.filter('move_t1w_gsp')
-        for i,scan in enumerate(scans, start=1):
-            sid = scan['id']
-            session = scan['session_label']
-            series = scan['series_description'].strip()
-            note = scan['note'].strip()
-            tag = f'MOVE_T1w_GSP_{i}'
-            updates.append({
-                'project': scan['session_project'],
-                'subject': scan['subject_label'],
-                'session': session, 
-                'scan': sid,
-                'series_description': series,
-                'note': note,
-                'tag': tag
-            })
-        return updates
-
-    def anat_t1w_gsp(self, scans):
-        updates = list()
-        scans = self.filter('anat_t1w_gsp')
-        for i,scan in enumerate(scans, start=1):
-            sid = scan['id']
-            session = scan['session_label']
-            series = scan['series_description'].strip()
-            note = scan['note'].strip()
-            tag = f'ANAT_T1w_GSP_{i}'
-            updates.append({
-                'project': scan['session_project'],
-                'subject': scan['subject_label'],
-                'session': session, 
-                'scan': sid,
-                'series_description': series,
-                'note': note,
-                'tag': tag
-            })
-        return updates
-
-    def move_t2w_gsp(self, scans):
-        updates = list()
-        scans = self.filter('move_t2w_gsp')
-        for i,scan in enumerate(scans, start=1):
-            sid = scan['id']
-            session = scan['session_label']
-            series = scan['series_description'].strip()
-            note = scan['note'].strip()
-            tag = f'MOVE_T2w_GSP_{i}'
-            updates.append({
-                'project': scan['session_project'],
-                'subject': scan['subject_label'],
-                'session': session, 
-                'scan': sid,
-                'series_description': series,
-                'note': note,
-                'tag': tag
-            })
-        return updates
-
-    def anat_t2w_gsp(self, scans):
-        updates = list()
-        scans = self.filter('anat_t2w_gsp')
-        for i,scan in enumerate(scans, start=1):
-            sid = scan['id']
-            session = scan['session_label']
-            series = scan['series_description'].strip()
-            note = scan['note'].strip()
-            tag = f'ANAT_T2w_GSP_{i}'
-            updates.append({
-                'project': scan['session_project'],
-                'subject': scan['subject_label'],
-                'session': session, 
-                'scan': sid,
-                'series_description': series,
-                'note': note,
-                'tag': tag
+                'session': scan['session_label'],
+                'scan': scan['id'],
+                'series_description': scan['series_description'].strip(),
+                'note': scan['note'].strip(),
+                'tag': f'{tag}_{i}'
             })
         return updates
 
     def upsert(self, confirm=False):
-        updates = list(self._squeeze(self.updates))
+        '''
+        Apply planned updates to the scan notes in XNAT.
+
+        Updates are indexed by scan ID and writes that would not change a
+        note are dropped before any requests are made. The remaining writes
+        are sent concurrently over a shared keep-alive session. Returns a
+        summary of applied, skipped, and failed writes.
+        '''
+        writes,skipped = self.notes()
+        summary = col.Counter(applied=0, skipped=skipped, failed=0)
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            futures = dict()
+            for scan,text in writes:
+                future = executor.submit(self.setnote, scan, text=text, confirm=False)
+                futures[future] = scan
+            for future in as_completed(futures):
+                sid = futures[future]['id']
+                try:
+                    future.result()
+                    summary['applied'] += 1
+                except (XnatError, requests.RequestException) as e:
+                    logger.error(f'failed to set note for scan {sid}: {e}')
+                    summary['failed'] += 1
+        logger.info('applied {applied}, skipped {skipped}, failed {failed}'.format(**summary))
+        return summary
+
+    def notes(self):
+        '''
+        Return a list of (scan, note) for every planned update that would
+        change a scan note, and the number of updates that are already in
+        place.
+        '''
+        index = dict()
+        for update in self._squeeze(self.updates):
+            sid = update['scan']
+            if sid in index:
+                raise UpsertError(f'found too many updates for scan {sid}')
+            index[sid] = update
+        skipped = 0
+        writes = list()
         for scan in self.scans:
             sid = scan['id']
-            note = scan['note']
-            update = [x for x in updates if x['scan'] == sid]
+            update = index.get(sid, None)
             if not update:
                 continue
-            if len(update) > 1:
-                raise UpsertError(f'found too many updates for scan {sid}')
-            update = update.pop()
             note = update['note'].strip()
             tag = update['tag'].strip()
-            if tag not in note:
-                upsert = tag
-                if note:
-                    upsert = f'{tag} {note}'
-                logger.info(f'setting note for scan {sid} to "{upsert}"')
-                self.setnote(scan, text=upsert, confirm=False)
-            else:
+            if tag in note:
                 logger.info(f"'{tag}' already in note '{note}'")
-
+                skipped += 1
+                continue
+            upsert = tag
+            if note:
+                upsert = f'{tag} {note}'
+            writes.append((scan, upsert))
+        return writes,skipped
 
     def _squeeze(self, updates):
         for _,items in iter(updates.items()):
@@ -248,39 +144,24 @@ class Tagger:
         subject = scan['subject_label'] 
         session = scan['session_label']
         scan_id = scan['id']
-        baseurl = self.auth.url.rstrip('/')
-        url = f'{baseurl}/data/projects/{project}/subjects/{subject}/experiments/{session}/scans/{scan_id}'
-        params = {
-            'xnat:mrscandata/note': text
-        }
         logger.info(f'setting note for {session} scan {scan_id} to {text}')
-        logger.info(f'PUT {url} params {params}')
         if confirm:
             input('press enter to execute request')
-        r = requests.put(url, params=params, auth=(self.auth.username, self.auth.password))
-        if r.status_code != requests.codes.OK:
-            raise SetNoteError(f'response not ok for {url}')
+        self.xnat.set_scan_fields(project, subject, session, scan_id, note=text)
 
     def get_scan_listing(self):
         '''
         Return scan listing as a list of dictionaries. 
         
-        This function attempts to read the scan listing from a 
-        cached JSON file. However, if a cached file doesn't exist, 
-        one will be created by saving the output from yaxil.scans.
+        The scan listing is read through the realta cache when one 
+        was given to the Tagger, otherwise it's fetched from XNAT.
         '''
-        cachefile = f'{self.session}.json'
-        self.scans = None
-        if not os.path.exists(cachefile):
-            logger.info(f'cache miss {cachefile}')
-            self.scans = list(yaxil.scans(self.auth, label=self.session))
-            if self.cache:
-                with open(cachefile, 'w') as fo:
-                    fo.write(json.dumps(self.scans, indent=2))
-        else:
-            logger.info(f'cache hit {cachefile}')
-            with open(cachefile) as fo:
-                self.scans = json.loads(fo.read())
+        self.scans = self.xnat.scans(label=self.session, project=self.project)
+        return self.scans
 
 class BadArgumentError(Exception):
     pass
+
+class UpsertError(Exception):
+    pass
+
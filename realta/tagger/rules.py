@@ -0,0 +1,114 @@
+import re
+import logging
+import collections as col
+import realta.lazy as lazy
+
+yaml = lazy.load('yaml')
+
+logger = logging.getLogger(__name__)
+
+Family = col.namedtuple('Family', [
+    'name',
+    'tag',
+    'quality',
+    'limit'
+])
+
+NoteTag = col.namedtuple('NoteTag', [
+    'family',
+    'number'
+])
+
+class Rules:
+    '''
+    Tag rules compiled from a tags.yaml configuration.
+
+    Every filter is indexed on (series_description, image_type, quality)
+    so that a scan can be assigned to all matching tag families with a
+    single dictionary lookup.
+    '''
+    def __init__(self, filters):
+        self.families = col.OrderedDict()
+        self.index = col.defaultdict(list)
+        for name,conf in iter(filters.items()):
+            family = Family(
+                name=name,
+                tag=conf['tag'],
+                quality=conf.get('quality', 'usable'),
+                limit=conf.get('limit', 1)
+            )
+            self.families[name] = family
+            for f in conf['filters']:
+                f = dict(f)
+                key = (
+                    f.pop('series_description'),
+                    tuple(f.pop('image_type')),
+                    f.pop('quality', family.quality)
+                )
+                self.index[key].append((name, f))
+        self.tags = dict((x.tag, x.name) for x in self.families.values())
+        alternatives = sorted(self.tags, key=len, reverse=True)
+        alternatives = '|'.join(re.escape(x) for x in alternatives)
+        self.pattern = re.compile(f'({alternatives})_(\\d+)')
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as fo:
+            filters = yaml.load(fo, Loader=yaml.SafeLoader)
+        return cls(filters)
+
+    def key(self, scan):
+        return (
+            scan.get('series_description', None),
+            split_image_type(scan.get('image_type', None)),
+            scan.get('quality', None)
+        )
+
+    def classify(self, scan):
+        '''
+        Return the names of all tag families that match a scan.
+        '''
+        names = list()
+        for name,residual in self.index.get(self.key(scan), []):
+            if name in names:
+                continue
+            match = True
+            for key,value in iter(residual.items()):
+                if key in scan and scan[key] != value:
+                    match = False
+            if match:
+                names.append(name)
+        return names
+
+    def parse_note(self, note):
+        '''
+        Return every tag found within a scan note as a set of NoteTag.
+        '''
+        result = set()
+        if not note:
+            return result
+        for match in self.pattern.finditer(note):
+            tag,number = match.groups()
+            result.add(NoteTag(self.tags[tag], int(number)))
+        return result
+
+    def assign(self, scans):
+        '''
+        Assign scans to tag families in a single pass. Every family is
+        present in the result, with matching scans in their original order.
+        '''
+        result = col.OrderedDict((name, list()) for name in self.families)
+        for scan in scans:
+            for name in self.classify(scan):
+                result[name].append(scan)
+        return result
+
+def split_image_type(image_type):
+    '''
+    Split a backslash delimited ImageType string into a tuple.
+    '''
+    if image_type is None:
+        return tuple()
+    if isinstance(image_type, str):
+        return tuple(re.split(r'\\+', image_type))
+    return tuple(image_type)
@@ -0,0 +1,452 @@
+import re
+import os
+import time
+import hashlib
+import logging
+import threading
+import collections as col
+import realta.lazy as lazy
+import realta.cache
+
+yaxil = lazy.load('yaxil')
+requests = lazy.load('requests')
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = 10
+TIMEOUT = (10, 300)
+BLOCKSIZE = 1024 * 1024
+
+# smallest fraction of a project's sessions that must be needed before all
+# of its scans are fetched with bulk queries instead of one session at a time
+BULK_FRACTION = 0.25
+
+# scan data types returned by yaxil.scans(), the search API joins one scan
+# data type at a time so each is requested separately
+SCAN_TYPES = (
+    'xnat:mrscandata',
+    'xnat:srscandata',
+    'xnat:scscandata',
+    'xnat:otherdicomscandata'
+)
+
+SESSION_COLUMNS = {
+    'ID': 'session_id',
+    'label': 'session_label',
+    'project': 'session_project',
+    'subject_label': 'subject_label'
+}
+
+SCAN_COLUMNS = {
+    'id': 'id',
+    'series_description': 'series_description',
+    'quality': 'quality',
+    'note': 'note',
+    'type': 'type'
+}
+
+# columns only MR scans have
+MR_SCAN_COLUMNS = {
+    'parameters/imagetype': 'image_type'
+}
+
+# scan fields that can be set and the PUT parameter for each, type is left
+# unqualified so it applies to every scan xsiType (e.g., otherDicom and SR
+# scans like PhoenixZIPReport), not only MR scans
+FIELDS = {
+    'note': 'xnat:mrscandata/note',
+    'type': 'type',
+    'quality': 'xnat:mrscandata/quality'
+}
+
+_clients = dict()
+_lock = threading.Lock()
+
+def client(alias, pool_size=POOL_SIZE, timeout=TIMEOUT, cache=None, cache_dir=None):
+    '''
+    Return the shared Client for an XNAT alias. The pool size, timeout,
+    cache, and cache directory are only used when the client is first
+    created.
+    '''
+    with _lock:
+        if alias not in _clients:
+            auth = yaxil.auth(alias)
+            _clients[alias] = Client(auth, pool_size=pool_size, timeout=timeout, cache=cache,
+                                     cache_dir=cache_dir)
+        return _clients[alias]
+
+class Client:
+    '''
+    XNAT REST client backed by a single pooled requests.Session.
+
+    Every request is sent with the same credentials (basic auth and the
+    JSESSIONID cookie, when present) and reuses warm connections from a
+    pool of up to pool_size connections.
+
+    When a realta.cache.Cache is attached, scan and experiment listings are
+    read through it. Cached entries are keyed by server as well as session,
+    so the same session label on two servers is cached separately. Any scan
+    field update invalidates the cached entries for that session, in the
+    attached cache or otherwise in cache_dir (~/.cache/realta by default),
+    whether or not listings were read through the cache.
+    '''
+    def __init__(self, auth, pool_size=POOL_SIZE, timeout=TIMEOUT, cache=None, cache_dir=None):
+        self.auth = auth
+        self.cache = cache
+        self.cache_dir = cache_dir or realta.cache.DIRECTORY
+        self.baseurl = auth.url.rstrip('/')
+        self.namespace = self.baseurl.split('://', 1)[-1]
+        self.timeout = timeout
+        self.session = requests.Session()
+        if auth.username and auth.password:
+            self.session.auth = (auth.username, auth.password)
+        if auth.cookie:
+            self.session.cookies.update(auth.cookie)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def key(self, session):
+        '''
+        Return the cache key for a session on this server.
+        '''
+        return f'{self.namespace}/{session}'
+
+    def url(self, path):
+        path = path.lstrip('/')
+        return f'{self.baseurl}/{path}'
+
+    def request(self, method, path, **kwargs):
+        url = self.url(path)
+        kwargs.setdefault('timeout', self.timeout)
+        r = self.session.request(method, url, **kwargs)
+        if r.status_code != requests.codes.ok:
+            params = kwargs.get('params', None)
+            raise XnatError(f'{method} {url} with params {params} returned {r.status_code}')
+        return r
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def experiments(self, label=None, project=None):
+        '''
+        Return a list of yaxil.Experiment, read through the cache.
+        '''
+        def fetch():
+            experiments = yaxil.experiments(self.auth, label=label, project=project)
+            return [x._asdict() for x in experiments]
+        if not self.cache:
+            return [yaxil.Experiment(**x) for x in fetch()]
+        name = f'experiments-{project}'
+        items = self.cache.get_or_set(self.key(label or '_all'), name, fetch)
+        return [yaxil.Experiment(**x) for x in items]
+
+    def scans(self, label=None, project=None, experiment=None):
+        '''
+        Return the scan listing for an experiment, read through the cache.
+        '''
+        if experiment:
+            label,project = experiment.label,experiment.project
+        def fetch():
+            return list(yaxil.scans(self.auth, label=label, project=project))
+        if not self.cache:
+            return fetch()
+        return self.cache.get_or_set(self.key(label), f'scans-{project}', fetch)
+
+    def project_scans(self, project):
+        '''
+        Return the scan listing for every session in a project with one
+        search query per scan data type in SCAN_TYPES, as a dictionary of
+        (project, session label) to a list of scans. Only the columns listed
+        in SESSION_COLUMNS and SCAN_COLUMNS are requested.
+        '''
+        def fetch():
+            scans = list()
+            for xsitype in SCAN_TYPES:
+                columns = dict((f'{xsitype}/{k}', v) for k,v in iter(SCAN_COLUMNS.items()))
+                if xsitype == 'xnat:mrscandata':
+                    columns.update((f'{xsitype}/{k}', v) for k,v in iter(MR_SCAN_COLUMNS.items()))
+                columns.update(SESSION_COLUMNS)
+                params = {
+                    'xsiType': 'xnat:mrSessionData',
+                    'project': project,
+                    'columns': ','.join(columns),
+                    'format': 'json'
+                }
+                r = self.get('/data/experiments', params=params)
+                for item in r.json()['ResultSet']['Result']:
+                    if not item.get(f'{xsitype}/id', None):
+                        continue
+                    scan = dict((v, '') for v in MR_SCAN_COLUMNS.values())
+                    for key,value in iter(columns.items()):
+                        scan[value] = item.get(key, '')
+                    scan['ID'] = scan['id']
+                    scans.append(scan)
+            return scans
+        if self.cache:
+            scans = self.cache.get_or_set(self.key(f'project-{project}'), 'image-scans', fetch)
+        else:
+            scans = fetch()
+        result = dict()
+        for scan in scans:
+            key = (scan['session_project'], scan['session_label'])
+            result.setdefault(key, list()).append(scan)
+        return result
+
+    def scan_ids(self, aid):
+        '''
+        Return the IDs of every scan within an experiment.
+        '''
+        params = {
+            'columns': 'ID',
+            'format': 'json'
+        }
+        r = self.get(f'/data/experiments/{aid}/scans', params=params)
+        return [x['ID'] for x in r.json()['ResultSet']['Result']]
+
+    def series_files(self, aid, collection='DICOM'):
+        '''
+        Return a dictionary of SeriesInstanceUID to the number of files in
+        the given resource of the matching scan, using one search query per
+        scan data type in SCAN_TYPES and one file listing for the whole
+        experiment.
+        '''
+        uids = dict()
+        for xsitype in SCAN_TYPES:
+            params = {
+                'xsiType': 'xnat:mrSessionData',
+                'ID': aid,
+                'columns': f'ID,{xsitype}/id,{xsitype}/uid',
+                'format': 'json'
+            }
+            r = self.get('/data/experiments', params=params)
+            for item in r.json()['ResultSet']['Result']:
+                if item.get(f'{xsitype}/id', None):
+                    uids[item[f'{xsitype}/id']] = item.get(f'{xsitype}/uid', None)
+        r = self.get(f'/data/experiments/{aid}/scans/ALL/files', params={'format': 'json'})
+        counts = col.Counter()
+        for item in r.json()['ResultSet']['Result']:
+            if item.get('collection', None) != collection:
+                continue
+            match = re.search('/scans/([^/]+)/resources/', item['URI'])
+            if match:
+                counts[match.group(1)] += 1
+        result = dict()
+        for scan,uid in iter(uids.items()):
+            if uid:
+                result[uid] = counts[scan]
+        return result
+
+    def last_modified(self, project=None, label=None):
+        '''
+        Return a dictionary of experiment accession ID to last modified
+        timestamp. The timestamp will be None if the server does not
+        report one.
+        '''
+        params = {
+            'columns': 'ID,last_modified',
+            'format': 'json'
+        }
+        if project:
+            params['project'] = project
+        if label:
+            params['label'] = label
+        r = self.get('/data/experiments', params=params)
+        result = dict()
+        for item in r.json()['ResultSet']['Result']:
+            result[item['ID']] = item.get('last_modified', None) or None
+        return result
+
+    def set_scan_fields(self, project, subject, session, scan, **fields):
+        '''
+        Set one or more scan fields (note, type, quality) with a single PUT.
+        '''
+        params = dict()
+        for field,value in iter(fields.items()):
+            if field not in FIELDS:
+                raise ValueError(f'unsupported scan field {field}')
+            params[FIELDS[field]] = value
+        path = f'/data/projects/{project}/subjects/{subject}/experiments/{session}/scans/{scan}'
+        logger.info(f'PUT {path} with params {params}')
+        try:
+            return self.put(path, params=params)
+        finally:
+            self.invalidate(project, session)
+
+    def invalidate(self, project, session):
+        '''
+        Discard cached listings for a session and the bulk scan listing for
+        its project, in the attached cache or otherwise in cache_dir.
+        '''
+        for key in (self.key(session), self.key(f'project-{project}')):
+            if self.cache:
+                self.cache.invalidate(key)
+            else:
+                realta.cache.invalidate(key, self.cache_dir)
+
+    def resources(self, aid):
+        '''
+        Return all resources for an experiment.
+        '''
+        path = f'/data/experiments/{aid}/resources'
+        params = {
+            'all': 'true',
+            'format': 'json'
+        }
+        r = self.get(path, params=params)
+        return r.json()['ResultSet']['Result']
+
+    def resource(self, aid, label):
+        '''
+        Return the experiment resource with the given label, or None.
+        '''
+        for item in self.resources(aid):
+            if item['label'] == label:
+                return item
+        return None
+
+    def put_resource(self, aid, label):
+        path = f'/data/experiments/{aid}/resources/{label}'
+        params = {
+            'n': 1
+        }
+        logger.info(f'PUT {path} with params {params}')
+        return self.put(path, params=params)
+
+    def files(self, aid, resource):
+        '''
+        Return the file listing for an experiment resource, including the
+        Size and digest (MD5) of each file when the server reports them.
+        '''
+        rid = resource['xnat_abstractresource_id']
+        path = f'/data/experiments/{aid}/resources/{rid}/files'
+        r = self.get(path, params={'format': 'json'})
+        return r.json()['ResultSet']['Result']
+
+    def file(self, aid, resource, name):
+        '''
+        Return the listing for a single file in an experiment resource, or
+        None.
+        '''
+        for item in self.files(aid, resource):
+            if item['Name'] == name:
+                return item
+        return None
+
+    def upload(self, aid, resource, filename, name, extract=False):
+        '''
+        Stream a local file into an experiment resource, replacing any file
+        with the same name. When extract is True, the file must be a zip
+        archive and the server will extract its contents into the resource.
+        '''
+        rid = resource['xnat_abstractresource_id']
+        path = f'/data/experiments/{aid}/resources/{rid}/files/{name}'
+        params = {
+            'inbody': 'true',
+            'overwrite': 'true'
+        }
+        if extract:
+            params['extract'] = 'true'
+        logger.info(f'PUT {path} with params {params} and file {filename}')
+        with Reader(filename) as reader:
+            return self.put(path, params=params, data=reader)
+
+class ScanListings:
+    '''
+    Scan listings for a set of experiments. A project's scans are fetched
+    in bulk when more than one of its sessions, and at least BULK_FRACTION
+    of all of its sessions, are needed. Otherwise scans are fetched one
+    session at a time.
+    '''
+    def __init__(self, client, experiments, listed=None, fraction=BULK_FRACTION):
+        self.client = client
+        self.bulk = dict()
+        needed = col.Counter(x.project for x in experiments)
+        totals = col.Counter(x.project for x in listed or experiments)
+        for project,count in iter(needed.items()):
+            if count > 1 and count >= fraction * totals[project]:
+                logger.info(f'fetching scans for {count} of {totals[project]} experiments in {project}')
+                self.bulk[project] = client.project_scans(project)
+
+    def scans(self, experiment):
+        project = experiment.project
+        if project in self.bulk:
+            scans = self.bulk[project].get((project, experiment.label), [])
+            return sorted(scans, key=scan_order)
+        return self.client.scans(experiment=experiment)
+
+def scan_order(scan):
+    '''
+    Sort key that puts scans from a bulk listing in scan number order, the
+    same order as a session scan listing.
+    '''
+    sid = scan['id']
+    if sid.isdigit():
+        return (0, int(sid), sid)
+    return (1, 0, sid)
+
+def checksum(filename):
+    '''
+    Return the MD5 digest of a file, reading it in blocks.
+    '''
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as fo:
+        for block in iter(lambda: fo.read(BLOCKSIZE), b''):
+            md5.update(block)
+    return md5.hexdigest()
+
+def unchanged(filename, remote):
+    '''
+    Check if a local file is identical to a remote file listing, comparing
+    sizes first and MD5 digests only if the sizes match. A remote file
+    without a digest is never considered unchanged.
+    '''
+    if not remote or str(remote.get('Size', '')) != str(os.path.getsize(filename)):
+        return False
+    digest = remote.get('digest', None)
+    if not digest:
+        return False
+    return checksum(filename) == digest
+
+class Reader:
+    '''
+    Read a file in blocks for a streamed request body, logging progress
+    along the way.
+    '''
+    def __init__(self, filename, interval=10):
+        self.filename = filename
+        self.size = os.path.getsize(filename)
+        self.interval = interval
+        self.sent = 0
+        self._fo = open(filename, 'rb')
+        self._last = time.monotonic()
+
+    def __len__(self):
+        return self.size - self.sent
+
+    def read(self, size=BLOCKSIZE):
+        block = self._fo.read(size)
+        self.sent += len(block)
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            logger.info(f'uploaded {self.sent / 1e6:.1f}/{self.size / 1e6:.1f} MB of {self.filename}')
+        return block
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._fo.close()
+
+class XnatError(Exception):
+    pass
@@ -6,8 +6,8 @@ here = os.path.abspath(os.path.dirname(__file__))
 requires = [
     'yaxil',
     'pydicom',
-    'pynetdicom',
-    'requests-cache'
+    # streaming relies on pynetdicom internals checked against 3.0
+    'pynetdicom>=3.0,<3.1'
 ]
 
 about = dict()
@@ -32,7 +32,13 @@ setup(
         'scripts/xnat_file_upload.py',
         'scripts/star_set_types.py',
         'scripts/star_tag_audit.py',
-        'scripts/star_set_tags.py'
+        'scripts/star_set_tags.py',
+        'scripts/star_reconcile.py'
     ],
+    entry_points={
+        'console_scripts': [
+            'realta=realta.cli:main'
+        ]
+    },
     install_requires=requires
 )